@@ -1,8 +1,20 @@
 import pygame
 import numpy as np
+from collections import deque
 from Colors import *
+from Clock import TICK
+from Geometry import circle_aabb_mask, capsule_aabb_mask
+from SpatialHash import SpatialHash
+
+# Passability (see passability) of an unknown leaf, one that a Focus left coarse while obstacles only partly
+# cover it (Node.unknown): half that of a free leaf, so that a plan prefers it to a blocked leaf and the leaf can
+# be decomposed again before the robot follows the plan
+UNKNOWN_PASSABILITY = 0.5
+
 
 class AABB:
+    __slots__ = ('x', 'y', 'width', 'height')
+
     def __init__(self, x, y, width, height):
         self.x = x
         self.y = y
@@ -13,8 +25,7 @@ class AABB:
         return self.x - self.width / 2, self.x + self.width / 2, self.y - self.height / 2, self.y + self.height / 2
 
     def get_corners(self):
-        return [(self.x - self.width / 2, self.y - self.height / 2), (self.x + self.width / 2, self.y - self.height / 2),
-                (self.x - self.width / 2, self.y + self.height / 2), (self.x + self.width / 2, self.y + self.height / 2)]
+        return corners(self.x, self.y, self.width, self.height)
 
     def get_area(self):
         return self.width * self.height
@@ -48,8 +59,13 @@ class AABB:
         pygame.draw.rect(window, BLACK, (self.x - self.width / 2, self.y - self.height / 2, self.width, self.height), 1)
 
 
+# Number of past positions kept per obstacle (and drawn as its trail)
+HISTORY_DEPTH = 5
+
+
 class Obstacle(AABB):
-    def __init__(self, x, y, width, height, static, v, x_bound=(20, 20), y_bound=(20, 20)):
+    def __init__(self, x, y, width, height, static, v, x_bound=(20, 20), y_bound=(20, 20),
+                 history_depth=HISTORY_DEPTH):
         super().__init__(x, y, width, height)
         self.static = static
         self.v = np.array(v)
@@ -58,32 +74,34 @@ class Obstacle(AABB):
         self.x_bound = (x - x_bound[0], x + x_bound[1])
         self.y_bound = (y - y_bound[0], y + y_bound[1])
         self.counter = 0
-        self.history = []
+        self.history = deque(maxlen=history_depth)
 
     def draw(self, window, with_past=True):
         if with_past:
-            for pos_x, pos_y in self.history[-5:]:
+            for pos_x, pos_y in self.history:
                 pygame.draw.rect(window, GREY, (pos_x - self.width / 2, pos_y - self.height / 2, self.width, self.height))
         color = BLACK if self.static else CYAN
         pygame.draw.rect(window, color, (self.x - self.width / 2, self.y - self.height / 2, self.width, self.height))
 
-    def move(self):
+    # Advance by dt simulated seconds; v is the displacement per reference TICK
+    def move(self, dt=TICK):
         if not self.static:
             v_x, v_y = self.v
-            self.x += v_x
+            step = dt / TICK
+            self.x += v_x * step
             if self.x < self.x_bound[0]:
                 self.x = self.x_bound[0]
                 self.v = (-v_x, v_y)
             elif self.x > self.x_bound[1]:
                 self.x = self.x_bound[1]
                 self.v = (-v_x, v_y)
-            self.y += v_y
+            self.y += v_y * step
             if self.y < self.y_bound[0]:
                 self.y = self.y_bound[0]
-                self.v = (v_x, -v_y)
+                self.v = (self.v[0], -v_y)
             elif self.y > self.y_bound[1]:
                 self.y = self.y_bound[1]
-                self.v = (v_x, -v_y)
+                self.v = (self.v[0], -v_y)
         # self.counter += 1
         # if self.counter % 2 == 0:
         self.history.append((self.x, self.y))
@@ -92,32 +110,314 @@ class Obstacle(AABB):
         return f"Obstacle({self.x}, {self.y}, {self.width}, {self.height}, {self.static}, [{self.v[0]}, {self.v[1]}])"
 
 
+# Obstacle centres of the previous tick, refilled in place so that taking it costs O(#obstacles)
+# and allocates nothing once the number of obstacles is stable
+class PositionSnapshot:
+    def __init__(self):
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+
+    def __len__(self):
+        return self.x.shape[0]
+
+    def capture(self, obstacles):
+        if len(self) != len(obstacles):
+            self.x = np.empty(len(obstacles))
+            self.y = np.empty(len(obstacles))
+        if isinstance(obstacles, ObstacleSet):
+            np.copyto(self.x, obstacles.centers[:, 0])
+            np.copyto(self.y, obstacles.centers[:, 1])
+            return
+        for i, obstacle in enumerate(obstacles):
+            self.x[i] = obstacle.x
+            self.y[i] = obstacle.y
+
+
+# Struct-of-arrays obstacle container: one row per obstacle in centers / sizes / v / lower / upper.
+# All dynamic obstacles are advanced by a single vectorized move(). Iterating or indexing yields
+# ObstacleView objects, so code written against a list of Obstacle keeps working. The views read
+# their fields straight from the arrays, so a move() costs nothing per view.
+# The last history_depth positions live in a (history_depth, n, 2) ring buffer. Range, rectangle and
+# point queries go through a SpatialHash that move() updates incrementally, once there are at least
+# min_indexed obstacles; below that, keeping the hash up to date costs more per tick than testing every
+# box in one NumPy pass
+class ObstacleSet:
+    def __init__(self, obstacles=(), history_depth=HISTORY_DEPTH, cell_size=32, min_indexed=512):
+        self.centers = np.empty((0, 2))
+        self.sizes = np.empty((0, 2))
+        self.v = np.empty((0, 2))
+        self.static = np.empty(0, dtype=bool)
+        # 0 for static and 1 for dynamic obstacles, as a column that scales their displacement in move()
+        self.moving = np.empty((0, 1))
+        self.lower = np.empty((0, 2))
+        self.upper = np.empty((0, 2))
+        self.history_depth = history_depth
+        self.trail = np.empty((history_depth, 0, 2))
+        self.trail_head = 0
+        self.trail_size = 0
+        self.views = []
+        self.top_left = np.empty((0, 2))
+        self.bottom_right = np.empty((0, 2))
+        self.cell_size = cell_size
+        self.min_indexed = min_indexed
+        self.index = None
+        # Largest distance an obstacle moved during the last move()
+        self.max_step = 0
+        self.extend(obstacles)
+
+    def __len__(self):
+        return len(self.views)
+
+    def __iter__(self):
+        return iter(self.views)
+
+    def __getitem__(self, i):
+        return self.views[i]
+
+    def extend(self, obstacles):
+        obstacles = list(obstacles)
+        if not obstacles:
+            return
+        self.centers = np.vstack([self.centers, [(o.x, o.y) for o in obstacles]])
+        self.sizes = np.vstack([self.sizes, [(o.width, o.height) for o in obstacles]])
+        self.v = np.vstack([self.v, [tuple(o.v) for o in obstacles]])
+        self.static = np.concatenate([self.static, [o.static for o in obstacles]])
+        self.moving = (~self.static[:, None]).astype(float)
+        self.lower = np.vstack([self.lower, [(o.x_bound[0], o.y_bound[0]) for o in obstacles]])
+        self.upper = np.vstack([self.upper, [(o.x_bound[1], o.y_bound[1]) for o in obstacles]])
+        self.views += [ObstacleView(self, len(self.views) + i) for i in range(len(obstacles))]
+        self.clear_history()
+        self.refresh()
+
+    def append(self, obstacle):
+        self.extend([obstacle])
+
+    def pop(self):
+        view = self.views.pop()
+        (x1, x2), (y1, y2) = view.x_bound, view.y_bound
+        # Obstacle takes its bounds as distances from the centre
+        obstacle = Obstacle(view.x, view.y, view.width, view.height, view.static, tuple(view.v),
+                            (view.x - x1, x2 - view.x), (view.y - y1, y2 - view.y))
+        for name in ('centers', 'sizes', 'v', 'static', 'moving', 'lower', 'upper'):
+            setattr(self, name, getattr(self, name)[:-1])
+        self.clear_history()
+        self.refresh()
+        return obstacle
+
+    def clear_history(self):
+        self.trail = np.empty((self.history_depth, len(self), 2))
+        self.trail_head = 0
+        self.trail_size = 0
+
+    # Past positions of obstacle i, oldest first
+    def history(self, i):
+        return [tuple(self.trail[(self.trail_head - self.trail_size + k) % self.history_depth, i].tolist())
+                for k in range(self.trail_size)]
+
+    # Candidate indices for a rectangle: the spatial hash answer, or every obstacle without a hash
+    def candidates(self, x1, x2, y1, y2):
+        if self.index is None:
+            return np.arange(len(self))
+        return self.index.query_rect(x1, x2, y1, y2)
+
+    # Indices of the obstacles within distance r of point (closest-point distance)
+    def query_circle(self, point, r):
+        ids = self.candidates(point[0] - r, point[0] + r, point[1] - r, point[1] + r)
+        return ids[circle_aabb_mask(point, r, self.centers[ids], self.sizes[ids])]
+
+    # Indices of the obstacles whose closed box intersects the rectangle
+    def query_rect(self, x1, x2, y1, y2):
+        ids = self.candidates(x1, x2, y1, y2)
+        top_left, bottom_right = self.top_left[ids], self.bottom_right[ids]
+        return ids[(top_left[:, 0] <= x2) & (bottom_right[:, 0] >= x1) &
+                   (top_left[:, 1] <= y2) & (bottom_right[:, 1] >= y1)]
+
+    # Indices of the obstacles containing the point
+    def query_point(self, point):
+        return self.query_rect(point[0], point[0], point[1], point[1])
+
+    # Indices of the obstacles hit by a disc of the given radius moving in a straight line from p0 to p1.
+    # With p0 == p1 this is the footprint check at a single position
+    def swept_collisions(self, p0, p1, radius):
+        ids = self.candidates(min(p0[0], p1[0]) - radius, max(p0[0], p1[0]) + radius,
+                              min(p0[1], p1[1]) - radius, max(p0[1], p1[1]) + radius)
+        return ids[capsule_aabb_mask(p0, p1, radius, self.centers[ids], self.sizes[ids])]
+
+    # Views of the obstacles that intersect aabb
+    def overlapping(self, aabb):
+        return [self.views[i] for i in self.query_rect(*aabb.return_coordinate())]
+
+    def select(self, ids):
+        return ObstacleSelection(self, ids)
+
+    # query_circle for many points at once, e.g. look-ahead positions or several robots: (m, 2) points
+    # give a list of m index arrays
+    def query_circles(self, points, r):
+        return [np.flatnonzero(row) for row in circle_aabb_mask(points, r, self.centers, self.sizes)]
+
+    # Recompute the box corners and the spatial index
+    def refresh(self):
+        self.top_left, self.bottom_right = self.centers - self.sizes / 2, self.centers + self.sizes / 2
+        if len(self) < self.min_indexed:
+            self.index = None
+        elif self.index is not None and self.index.ranges.shape[0] == len(self):
+            self.index.update(self.top_left, self.bottom_right)
+        else:
+            self.index = SpatialHash(self.cell_size)
+            self.index.build(self.top_left, self.bottom_right)
+
+    # Same reflection at x_bound / y_bound as Obstacle.move, for every obstacle at once
+    def move(self, dt=TICK):
+        # Static obstacles do not move and sit within their bounds, so they never bounce either
+        centers = self.centers + self.v * self.moving * (dt / TICK)
+        bounced = (centers < self.lower) | (centers > self.upper)
+        np.maximum(centers, self.lower, out=centers)
+        np.minimum(centers, self.upper, out=centers)
+        step = centers - self.centers
+        self.max_step = float(np.hypot(step[:, 0], step[:, 1]).max()) if len(self) else 0
+        np.copyto(self.centers, centers)
+        self.v[bounced] *= -1
+        if self.history_depth:
+            self.trail[self.trail_head] = self.centers
+            self.trail_head = (self.trail_head + 1) % self.history_depth
+            self.trail_size = min(self.trail_size + 1, self.history_depth)
+        self.refresh()
+
+
+# Subset of an ObstacleSet (e.g. the obstacles a robot senses): a list of views that still answers
+# spatial queries through the set's index
+class ObstacleSelection(list):
+    def __init__(self, obstacle_set, ids):
+        super().__init__(obstacle_set.views[i] for i in ids)
+        self.obstacle_set = obstacle_set
+        self.ids = np.asarray(ids, dtype=int)
+
+    def overlapping(self, aabb):
+        ids = self.obstacle_set.query_rect(*aabb.return_coordinate())
+        return [self.obstacle_set.views[i] for i in ids[np.isin(ids, self.ids)]]
+
+
+# Obstacle backed by one row of an ObstacleSet
+class ObstacleView(Obstacle):
+    def __init__(self, obstacle_set, index):
+        self.obstacle_set = obstacle_set
+        self.index = index
+
+    @property
+    def x(self):
+        return self.obstacle_set.centers.item(self.index, 0)
+
+    @x.setter
+    def x(self, value):
+        self.obstacle_set.centers[self.index, 0] = value
+        self.obstacle_set.refresh()
+
+    @property
+    def y(self):
+        return self.obstacle_set.centers.item(self.index, 1)
+
+    @y.setter
+    def y(self, value):
+        self.obstacle_set.centers[self.index, 1] = value
+        self.obstacle_set.refresh()
+
+    @property
+    def width(self):
+        return self.obstacle_set.sizes.item(self.index, 0)
+
+    @property
+    def height(self):
+        return self.obstacle_set.sizes.item(self.index, 1)
+
+    @property
+    def static(self):
+        return bool(self.obstacle_set.static[self.index])
+
+    @property
+    def v(self):
+        return self.obstacle_set.v[self.index]
+
+    @v.setter
+    def v(self, value):
+        self.obstacle_set.v[self.index] = value
+
+    def return_coordinate(self):
+        top_left, bottom_right = self.obstacle_set.top_left, self.obstacle_set.bottom_right
+        return (top_left.item(self.index, 0), bottom_right.item(self.index, 0), top_left.item(self.index, 1),
+                bottom_right.item(self.index, 1))
+
+    @property
+    def x_bound(self):
+        return self.obstacle_set.lower.item(self.index, 0), self.obstacle_set.upper.item(self.index, 0)
+
+    @property
+    def y_bound(self):
+        return self.obstacle_set.lower.item(self.index, 1), self.obstacle_set.upper.item(self.index, 1)
+
+    @property
+    def history(self):
+        return self.obstacle_set.history(self.index)
+
+
+# Region that is decomposed at full resolution: everything within radius of one of the points, typically the
+# robot, the goal and the previous path. Nodes entirely farther away stop splitting at coarse_size instead of
+# threshold_size, so the far part of a large world yields few, coarse leaves
+class Focus:
+    def __init__(self, points, radius, coarse_size=64):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.point_list = self.points.tolist()
+        self.radius = radius
+        self.coarse_size = coarse_size
+
+    # Closest-point distances of boxes (top-left / bottom-right corner arrays) to the focus points are within
+    # radius
+    def near(self, top_left, bottom_right):
+        d = np.maximum(np.maximum(top_left[..., None, :] - self.points, self.points - bottom_right[..., None, :]), 0)
+        return np.any(np.sum(np.square(d), axis=-1) <= self.radius ** 2, axis=-1)
+
+    # threshold_size to use for a node
+    def size(self, node, threshold_size):
+        x1, x2, y1, y2 = node.return_coordinate()
+        for x, y in self.point_list:
+            dx = max(x1 - x, x - x2, 0)
+            dy = max(y1 - y, y - y2, 0)
+            if dx * dx + dy * dy <= self.radius * self.radius:
+                return threshold_size
+        return max(threshold_size, self.coarse_size)
+
+
 class Node(AABB):
+    # Slotted: no per-node __dict__, which matters with millions of leaves (see Environment.memory_report)
+    __slots__ = ('neighbors', 'h', 'rhs', 'g', 'key', 'parent', 'percentage', 'static_percentage', 'value',
+                 'unknown', 'NW', 'NE', 'SW', 'SE', 'region', 'leaves')
+
     def __init__(self, x, y, width, height, parent=None, region=None):
         super().__init__(x, y, width, height)
         # Neighbor list
         self.neighbors = []
 
         # D* properties
-        self.in_queue = False
         self.h = 0
         self.rhs = np.inf
         self.g = np.inf
-        self.key = [np.inf, np.inf]
+        self.key = (np.inf, np.inf)
 
         # Determining neighbors and values for QuadTree
         self.parent = parent
         self.percentage = 0
+        # Part of percentage due to static obstacles, kept once computed (see layered_covering)
+        self.static_percentage = None
         self.value = -1
+        # Leaf a Focus left coarse while obstacles only partly cover it. Its value is 0, the solvers see it
+        # through passability
+        self.unknown = False
         self.NW = None
         self.NE = None
         self.SW = None
         self.SE = None
         self.region = region
-
-        # Start / Goal indicators
-        self.start = False
-        self.goal = False
+        # Leaves under this node, kept until a split or merge below it (see invalidate_leaves)
+        self.leaves = None
 
     def get_children(self):
         if self.NW is None:
@@ -125,6 +425,7 @@ class Node(AABB):
         return [self.NW, self.NE, self.SW, self.SE]
 
     def split(self):
+        self.invalidate_leaves()
         self.NW = Node(self.x - self.width / 4, self.y - self.height / 4, self.width / 2, self.height / 2,
                        parent=self, region="NW")
         self.NE = Node(self.x + self.width / 4, self.y - self.height / 4, self.width / 2, self.height / 2,
@@ -134,31 +435,146 @@ class Node(AABB):
         self.SE = Node(self.x + self.width / 4, self.y + self.height / 4, self.width / 2, self.height / 2,
                        parent=self, region="SE")
 
-    def set_value(self, threshold_percentage, threshold_size):
+    # coarse: the node is above full resolution and only small for a Focus coarsening of threshold_size, in which
+    # case it is unknown when obstacles only partly cover it
+    def set_value(self, threshold_percentage, threshold_size, coarse=False):
+        self.unknown = False
         if self.width > threshold_size and self.height > threshold_size:
             if self.percentage <= threshold_percentage:
                 self.value = 0
+                self.reset_children()
             elif self.percentage >= 1 - threshold_percentage:
                 self.value = 1
                 self.reset_children()
             else:
                 self.value = -1
         else:
+            # Split finer before, under a Focus that has moved away since
+            self.reset_children()
             if self.percentage <= threshold_percentage:
                 self.value = 0
+            elif coarse and self.percentage < 1 - threshold_percentage:
+                self.value = 0
+                self.unknown = True
             else:
                 self.value = 1
 
-    def update_percentage_and_split(self, obstacles, threshold_percentage=0.005, threshold_size=16):
-        for obstacle in obstacles:
-            intersect_percentage = self.get_intersect_percentage(obstacle)
-            self.percentage += intersect_percentage
-        self.set_value(threshold_percentage, threshold_size)
+    # focus: optional Focus, which coarsens threshold_size away from the robot
+    # static: optional static obstacles, in which case obstacles are only the dynamic ones (see layered_covering)
+    def update_percentage_and_split(self, obstacles, threshold_percentage=0.005, threshold_size=16, focus=None,
+                                    static=None):
+        self.percentage = 0
+        if static is None:
+            covering = self.covering(obstacles)
+        else:
+            covering, static = self.layered_covering(obstacles, static)
+        self.set_value(threshold_percentage, threshold_size if focus is None else focus.size(self, threshold_size),
+                       self.width > threshold_size and self.height > threshold_size)
         if self.value == -1:
-            if self.get_children() is None:
+            if self.NW is None:
                 self.split()
             for child in self.get_children():
-                child.update_percentage_and_split(obstacles, threshold_percentage, threshold_size)
+                child.update_percentage_and_split(covering, threshold_percentage, threshold_size, focus, static)
+            self.merge_blocked()
+
+    # Same decomposition as update_percentage_and_split with the occupied fraction read from an OccupancyGrid:
+    # (x1, y1, w, h) is this node's pixel block, and the children's blocks are its quarters
+    def update_from_occupancy(self, occupancy, x1, y1, w, h, threshold_percentage=0.005, threshold_size=16,
+                              focus=None):
+        self.percentage = float(occupancy.fraction(x1, y1, w, h))
+        self.set_value(threshold_percentage, threshold_size if focus is None else focus.size(self, threshold_size),
+                       self.width > threshold_size and self.height > threshold_size)
+        if self.value == -1:
+            if self.NW is None:
+                self.split()
+            w, h = w // 2, h // 2
+            for child, cx, cy in ((self.NW, x1, y1), (self.NE, x1 + w, y1), (self.SW, x1, y1 + h),
+                                  (self.SE, x1 + w, y1 + h)):
+                child.update_from_occupancy(occupancy, cx, cy, w, h, threshold_percentage, threshold_size, focus)
+            self.merge_blocked()
+
+    # Add up percentage over the obstacles and return the ones that actually cover part of this node: the
+    # only ones the children need to look at
+    def covering(self, obstacles):
+        covering = []
+        for obstacle in overlapping(obstacles, self):
+            intersect_percentage = self.get_intersect_percentage(obstacle)
+            if intersect_percentage > 0:
+                self.percentage += intersect_percentage
+                covering.append(obstacle)
+        return covering
+
+    # covering with the obstacles split into a static and a dynamic layer: the static obstacles are intersected
+    # with a node only the first time and their share is kept in static_percentage, so that later updates only
+    # intersect the dynamic ones. Returns the covering dynamic and static obstacles; when static_percentage was
+    # already known, the static obstacles are passed on as they are, or none if they do not cover this node
+    def layered_covering(self, obstacles, static):
+        if self.static_percentage is None:
+            static = self.covering(static)
+            self.static_percentage = self.percentage
+        else:
+            self.percentage = self.static_percentage
+            if self.static_percentage == 0:
+                static = []
+        return self.covering(obstacles), static
+
+    # Collapse four sibling leaves that are all blocked back into this node
+    def merge_blocked(self):
+        children = self.get_children()
+        if any(child.NW is not None or child.value != 1 for child in children):
+            return False
+        self.reset_children()
+        self.value = 1
+        return True
+
+    # Re-split or merge only the subtrees that intersect regions, a (k, 4) array of (x1, x2, y1, y2)
+    # rectangles such as the old and new extents of the obstacles that moved. Leaves that left the tree are
+    # appended to removed, new leaves to added and remaining leaves whose value changed to changed.
+    # A subdivided node only merges into a free leaf once its percentage drops to merge_percentage, below the
+    # split threshold, so an obstacle edge hovering around the threshold does not split and merge it every time.
+    # static, focus: as in update_percentage_and_split
+    def update_region(self, obstacles, regions, removed, added, changed, threshold_percentage=0.005,
+                      threshold_size=16, merge_percentage=0.0025, static=None, focus=None):
+        x1, x2, y1, y2 = self.return_coordinate()
+        if not np.any((regions[:, 0] < x2) & (regions[:, 1] > x1) & (regions[:, 2] < y2) & (regions[:, 3] > y1)):
+            return
+        children = self.get_children()
+        value, unknown = self.value, self.unknown
+        self.percentage = 0
+        if static is None:
+            covering = self.covering(obstacles)
+        else:
+            covering, static = self.layered_covering(obstacles, static)
+        if children is not None and merge_percentage < self.percentage <= threshold_percentage:
+            self.value = -1
+        else:
+            self.set_value(threshold_percentage, threshold_size if focus is None else focus.size(self, threshold_size),
+                           self.width > threshold_size and self.height > threshold_size)
+        if self.value != -1:
+            if children is not None:
+                for child in children:
+                    removed.extend(child.get_leaves())
+                added.append(self)
+            elif self.value != value or self.unknown != unknown:
+                changed.append(self)
+        elif children is None:
+            self.split()
+            for child in self.get_children():
+                child.update_percentage_and_split(covering, threshold_percentage, threshold_size, focus, static)
+            if self.merge_blocked():
+                if value != 1:
+                    changed.append(self)
+            else:
+                removed.append(self)
+                for child in self.get_children():
+                    added.extend(child.get_leaves())
+        else:
+            for child in children:
+                child.update_region(covering, regions, removed, added, changed, threshold_percentage,
+                                    threshold_size, merge_percentage, static, focus)
+            if self.merge_blocked():
+                removed.extend(children)
+                added.append(self)
 
     def get_north_neighbor(self):
         if self.parent is None:
@@ -169,7 +585,7 @@ class Node(AABB):
             return self.parent.NE
 
         u = self.parent.get_north_neighbor()
-        if u is None or u.get_children() is None:
+        if u is None or u.NW is None:
             return u
         if self.region == "NW":
             return u.SW
@@ -185,7 +601,7 @@ class Node(AABB):
             return self.parent.SE
 
         u = self.parent.get_south_neighbor()
-        if u is None or u.get_children() is None:
+        if u is None or u.NW is None:
             return u
         if self.region == "SW":
             return u.NW
@@ -201,7 +617,7 @@ class Node(AABB):
             return self.parent.SW
 
         u = self.parent.get_left_neighbor()
-        if u is None or u.get_children() is None:
+        if u is None or u.NW is None:
             return u
         if self.region == "NW":
             return u.NE
@@ -217,7 +633,7 @@ class Node(AABB):
             return self.parent.SE
 
         u = self.parent.get_right_neighbor()
-        if u is None or u.get_children() is None:
+        if u is None or u.NW is None:
             return u
         if self.region == "NE":
             return u.NW
@@ -231,16 +647,16 @@ class Node(AABB):
             return self.parent.NW
         if self.region == "NE":
             u = self.parent.get_north_neighbor()
-            if u is None or u.get_children() is None:
+            if u is None or u.NW is None:
                 return u
             return u.SW
         if self.region == "SW":
             u = self.parent.get_left_neighbor()
-            if u is None or u.get_children() is None:
+            if u is None or u.NW is None:
                 return u
             return u.NE
         u = self.parent.get_north_west_neighbor()
-        if u is None or u.get_children() is None:
+        if u is None or u.NW is None:
             return u
         return u.SE
 
@@ -251,16 +667,16 @@ class Node(AABB):
             return self.parent.NE
         if self.region == "NW":
             u = self.parent.get_north_neighbor()
-            if u is None or u.get_children() is None:
+            if u is None or u.NW is None:
                 return u
             return u.SE
         if self.region == "SE":
             u = self.parent.get_right_neighbor()
-            if u is None or u.get_children() is None:
+            if u is None or u.NW is None:
                 return u
             return u.NW
         u = self.parent.get_north_east_neighbor()
-        if u is None or u.get_children() is None:
+        if u is None or u.NW is None:
             return u
         return u.SW
 
@@ -271,16 +687,16 @@ class Node(AABB):
             return self.parent.SW
         if self.region == "SE":
             u = self.parent.get_south_neighbor()
-            if u is None or u.get_children():
+            if u is None or u.NW is None:
                 return u
             return u.NW
         if self.region == "NW":
             u = self.parent.get_left_neighbor()
-            if u is None or u.get_children() is None:
+            if u is None or u.NW is None:
                 return u
             return u.SE
         u = self.parent.get_south_west_neighbor()
-        if u is None or u.get_children() is None:
+        if u is None or u.NW is None:
             return u
         return u.NE
 
@@ -291,98 +707,124 @@ class Node(AABB):
             return self.parent.SE
         if self.region == "NE":
             u = self.parent.get_right_neighbor()
-            if u is None or u.get_children() is None:
+            if u is None or u.NW is None:
                 return u
             return u.SW
         if self.region == "SW":
             u = self.parent.get_south_neighbor()
-            if u is None or u.get_children() is None:
+            if u is None or u.NW is None:
                 return u
             return u.NE
         u = self.parent.get_south_east_neighbor()
-        if u is None or u.get_children() is None:
+        if u is None or u.NW is None:
             return u
         return u.NW
 
+    # Leaves along one side of this node, in order: first and second are the two child regions on that side
+    def get_side_children(self, first, second):
+        leaves = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.NW is None:
+                leaves.append(node)
+            else:
+                stack.append(getattr(node, second))
+                stack.append(getattr(node, first))
+        return leaves
+
+    # The leaf in one corner of this node
+    def get_corner_child(self, region):
+        node = self
+        while node.NW is not None:
+            node = getattr(node, region)
+        return [node]
+
     def get_north_children(self):
-        if self.get_children():
-            return self.NW.get_north_children() + self.NE.get_north_children()
-        return [self]
+        return self.get_side_children('NW', 'NE')
 
     def get_south_children(self):
-        if self.get_children():
-            return self.SW.get_south_children() + self.SE.get_south_children()
-        return [self]
+        return self.get_side_children('SW', 'SE')
 
     def get_left_children(self):
-        if self.get_children():
-            return self.NW.get_left_children() + self.SW.get_left_children()
-        return [self]
+        return self.get_side_children('NW', 'SW')
 
     def get_right_children(self):
-        if self.get_children():
-            return self.NE.get_right_children() + self.SE.get_right_children()
-        return [self]
+        return self.get_side_children('NE', 'SE')
 
     def get_north_west_children(self):
-        if self.get_children():
-            return self.NW.get_north_west_children()
-        return [self]
+        return self.get_corner_child('NW')
 
     def get_north_east_children(self):
-        if self.get_children():
-            return self.NE.get_north_east_children()
-        return [self]
+        return self.get_corner_child('NE')
 
     def get_south_west_children(self):
-        if self.get_children():
-            return self.SW.get_south_west_children()
-        return [self]
+        return self.get_corner_child('SW')
 
     def get_south_east_children(self):
-        if self.get_children():
-            return self.SE.get_south_east_children()
-        return [self]
+        return self.get_corner_child('SE')
 
     def update_neighbors(self):
+        self.neighbors = []
         north = self.get_north_neighbor()
         if north:
-            self.neighbors = self.neighbors + north.get_south_children()
+            self.neighbors.extend(north.get_south_children())
         south = self.get_south_neighbor()
         if south:
-            self.neighbors = self.neighbors + south.get_north_children()
+            self.neighbors.extend(south.get_north_children())
         left = self.get_left_neighbor()
         if left:
-            self.neighbors = self.neighbors + left.get_right_children()
+            self.neighbors.extend(left.get_right_children())
         right = self.get_right_neighbor()
         if right:
-            self.neighbors = self.neighbors + right.get_left_children()
+            self.neighbors.extend(right.get_left_children())
         north_west = self.get_north_west_neighbor()
         if north_west:
-            self.neighbors = self.neighbors + north_west.get_south_east_children()
+            self.neighbors.extend(north_west.get_south_east_children())
         north_east = self.get_north_east_neighbor()
         if north_east:
-            self.neighbors = self.neighbors + north_east.get_south_west_children()
+            self.neighbors.extend(north_east.get_south_west_children())
         south_west = self.get_south_west_neighbor()
         if south_west:
-            self.neighbors = self.neighbors + south_west.get_north_east_children()
+            self.neighbors.extend(south_west.get_north_east_children())
         south_east = self.get_south_east_neighbor()
         if south_east:
-            self.neighbors = self.neighbors + south_east.get_north_west_children()
+            self.neighbors.extend(south_east.get_north_west_children())
+        # A larger neighbor across an edge also covers the corners next to it
+        self.neighbors = list(dict.fromkeys(self.neighbors))
 
     def reset_children(self):
+        if self.NW is not None:
+            self.invalidate_leaves()
         self.NW = None
         self.NE = None
         self.SW = None
         self.SE = None
 
+    # Leaves under this node in NW, NE, SW, SE order. The list is cached until the structure below this node
+    # changes and is shared between callers, so it must not be modified
     def get_leaves(self):
-        if self.get_children() is None:
-            return [self]
-        return self.NW.get_leaves() + self.NE.get_leaves() + self.SW.get_leaves() + self.SE.get_leaves()
+        if self.leaves is None:
+            leaves = []
+            stack = [self]
+            while stack:
+                node = stack.pop()
+                if node.NW is None:
+                    leaves.append(node)
+                else:
+                    stack += (node.SE, node.SW, node.NE, node.NW)
+            self.leaves = leaves
+        return self.leaves
+
+    # Drop the cached leaf lists of this node and its ancestors
+    def invalidate_leaves(self):
+        node = self
+        while node is not None:
+            node.leaves = None
+            node = node.parent
 
     def calculate_key(self):
-        self.key = [min(self.g, self.rhs) + self.h, min(self.g, self.rhs)]
+        self.key = (min(self.g, self.rhs) + self.h, min(self.g, self.rhs))
         return self.key
 
     def calculate_rhs(self):
@@ -392,12 +834,50 @@ class Node(AABB):
 
     def draw(self, window):
         pygame.draw.rect(window, BLACK, (self.x - self.width / 2, self.y - self.height / 2,
-                                         self.width, self.height), 1 - self.value)
+                                         self.width, self.height), 0 if self.value == 1 else 1)
+
+
+# Obstacles that may intersect aabb: all of them for a plain list, the spatial index answer for an
+# ObstacleSet or ObstacleSelection
+def overlapping(obstacles, aabb):
+    if isinstance(obstacles, (ObstacleSet, ObstacleSelection)):
+        return obstacles.overlapping(aabb)
+    return obstacles
+
+
+# (top-left, bottom-right) corner arrays of a list of obstacles or an ObstacleSet
+def obstacle_bounds(obstacles):
+    if isinstance(obstacles, ObstacleSet):
+        return obstacles.top_left, obstacles.bottom_right
+    coordinates = np.array([obstacle.return_coordinate() for obstacle in obstacles], dtype=float).reshape(-1, 4)
+    return coordinates[:, [0, 2]], coordinates[:, [1, 3]]
+
+
+# (static, dynamic) obstacles of a list or an ObstacleSet; for an ObstacleSet both are selections that still
+# answer overlapping() through its spatial index
+def split_static(obstacles):
+    if isinstance(obstacles, ObstacleSet):
+        return (obstacles.select(np.flatnonzero(obstacles.static)),
+                obstacles.select(np.flatnonzero(~obstacles.static)))
+    return [o for o in obstacles if o.static], [o for o in obstacles if not o.static]
+
+
+def corners(x, y, width, height):
+    return [(x - width / 2, y - height / 2), (x + width / 2, y - height / 2),
+            (x - width / 2, y + height / 2), (x + width / 2, y + height / 2)]
 
 
 def distance(node1, node2):
     return np.sqrt((node1.x - node2.x) ** 2 + (node1.y - node2.y) ** 2)
 
 
+# Factor cost() applies to an edge entering the node and divides an edge leaving it by: next to 1 for a free
+# node and next to 0 for a blocked one
+def passability(node):
+    if node.unknown:
+        return UNKNOWN_PASSABILITY + 1e-6
+    return 1 + 1e-6 - min(1, 100 * node.value)
+
+
 def cost(node1, node2):
-    return distance(node1, node2) / (1 + 1e-6 - min(1, node1.value * 100)) * (1 + 1e-6 - min(1, 100 * node2.value))
+    return distance(node1, node2) / passability(node1) * passability(node2)
@@ -1,7 +1,95 @@
+import argparse
+import os
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
 from QuadTree import main
-# One of: [dense, maze, room, trap]
-scenario = input("Enter scenario: ")
-# One of: [Quad_Dstar_Tree, grid, Astar, OnlyReplan]
-algorithm = input("Enter algorithm: ")
-for i in range(1, 21):
-    main(algorithm, scenario, scenario + str(i), False)
+
+SCENARIOS = ['dense', 'maze', 'room', 'trap']
+ALGORITHMS = ['Quad_Dstar_Tree', 'grid', 'Astar', 'OnlyReplan']
+
+
+# Run one (scenario, algorithm, map) cell headless, writing into private files so that
+# concurrent workers never share a file handle. Returns the action lines, the binary action
+# records (empty unless binary_telemetry) and the result lines. A run that raises is recorded
+# as an Error result line with the traceback on stderr, so one bad cell does not end the sweep.
+def run_cell(cell):
+    scenario, algorithm, test_map, max_ticks, binary_telemetry, cache, focus_radius = cell
+    with tempfile.TemporaryDirectory() as tmp:
+        action_path = os.path.join(tmp, 'action')
+        result_path = os.path.join(tmp, 'result')
+        open(action_path, 'w').close()
+        open(result_path, 'w').close()
+        try:
+            main(algorithm, scenario, test_map, interactive=False, headless=True,
+                 action_path=action_path, result_path=result_path, binary_telemetry=binary_telemetry,
+                 max_ticks=max_ticks, decomposition_cache=cache, focus_radius=focus_radius)
+        except Exception:
+            traceback.print_exc()
+            with open(result_path, 'a') as f:
+                f.write(f"{test_map}: nan nan nan Error \n")
+        with open(action_path) as f:
+            action = f.read()
+        action_records = b''
+        if binary_telemetry and os.path.exists(action_path + '.bin'):
+            with open(action_path + '.bin', 'rb') as f:
+                action_records = f.read()
+        with open(result_path) as f:
+            result = f.read()
+    return action, action_records, result
+
+
+# Append text to a line-oriented file, starting on a new line if the file does not end with one
+def append_lines(path, text):
+    with open(path, 'a+') as f:
+        if f.tell():
+            f.seek(f.tell() - 1)
+            if f.read(1) != '\n':
+                f.write('\n')
+        f.write(text)
+
+
+# Run every cell of scenarios x algorithms x maps in a process pool. Only this process
+# appends to action/<scenario>/<algorithm> and result/<scenario>/<algorithm>, in matrix order.
+# Runs that do not reach the goal within max_ticks are recorded as Fail instead of blocking the sweep.
+# With cache, the workers share quadtree decompositions of static maps through that directory.
+# With focus_radius, the quadtrees are only decomposed at full resolution near the robot (see QuadTree.main).
+def run_batch(scenarios=SCENARIOS, algorithms=ALGORITHMS, map_ids=range(1, 21), workers=None, max_ticks=3000,
+              binary_telemetry=False, cache=None, focus_radius=None):
+    cells = [(scenario, algorithm, scenario + str(i), max_ticks, binary_telemetry, cache, focus_radius)
+             for scenario, algorithm, i in product(scenarios, algorithms, map_ids)]
+    for scenario, algorithm in product(scenarios, algorithms):
+        os.makedirs('action/' + scenario, exist_ok=True)
+        os.makedirs('result/' + scenario, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for (scenario, algorithm, test_map, _, _, _, _), (action, action_records, result) in \
+                zip(cells, executor.map(run_cell, cells)):
+            append_lines('action/' + scenario + '/' + algorithm, action)
+            if binary_telemetry:
+                with open('action/' + scenario + '/' + algorithm + '.bin', 'ab') as f:
+                    f.write(action_records)
+            append_lines('result/' + scenario + '/' + algorithm, result)
+            print(scenario, algorithm, test_map, 'done')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    # Any of: [dense, maze, room, trap]
+    parser.add_argument('--scenarios', nargs='+', default=SCENARIOS)
+    # Any of: [Quad_Dstar_Tree, grid, Astar, OnlyReplan]
+    parser.add_argument('--algorithms', nargs='+', default=ALGORITHMS)
+    # From 1 to 20
+    parser.add_argument('--maps', nargs='+', type=int, default=list(range(1, 21)))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-ticks', type=int, default=3000)
+    # Also write action/<scenario>/<algorithm>.bin for action/CalAction.py
+    parser.add_argument('--binary', action='store_true')
+    # Directory for cached quadtree decompositions of static maps
+    parser.add_argument('--cache', default=None)
+    # Full resolution quadtree only within this distance of the robot, e.g. the regression run
+    # --scenarios maze real trap --maps 1 --algorithms Quad_Dstar_Tree --focus-radius 80
+    parser.add_argument('--focus-radius', type=float, default=None)
+    args = parser.parse_args()
+    run_batch(args.scenarios, args.algorithms, args.maps, args.workers, args.max_ticks, args.binary, args.cache,
+              args.focus_radius)
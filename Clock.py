@@ -0,0 +1,21 @@
+# Length (in seconds) of the reference tick the obstacle velocities in Obstacles.maps are expressed in
+TICK = 0.1
+
+
+# Fixed-timestep simulation clock. Every tick advances simulated time by dt, no matter how long the
+# tick took to compute or to render, so runs are reproducible at any speed and on any machine.
+class SimulationClock:
+    def __init__(self, dt=TICK):
+        self.dt = dt
+        self.ticks = 0
+
+    @property
+    def time(self):
+        return self.ticks * self.dt
+
+    def tick(self):
+        self.ticks += 1
+
+    # True once every `period` seconds of simulated time, starting with tick 0
+    def every(self, period):
+        return self.ticks % max(1, round(period / self.dt)) == 0
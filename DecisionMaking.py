@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 import numpy as np
+from AABB import corners, ObstacleSet
 
 
 def angle(x1, y1, x2, y2):
@@ -10,14 +11,22 @@ class DecisionMaking(ABC):
 
     def __init__(self):
         self.goal = None
-        self.obstacles_list_before = None
-        self.obstacles_list_after = None
+        self.positions_before = None
+        self.obstacles_list = None
 
-    def update(self, obstacles_list_before, obstacles_list_after, goal):
-        self.obstacles_list_before = obstacles_list_before
-        self.obstacles_list_after = obstacles_list_after
+    # positions_before: PositionSnapshot of the obstacles before they moved this tick
+    def update(self, positions_before, obstacles_list, goal):
+        self.positions_before = positions_before
+        self.obstacles_list = obstacles_list
         self.goal = goal
 
+    # Indices of the obstacles that were within reach of the robot's sensor before or after they moved.
+    # With an ObstacleSet only the neighbourhood of the robot is looked at
+    def nearby(self, rb):
+        if isinstance(self.obstacles_list, ObstacleSet):
+            return self.obstacles_list.query_circle(rb.pos, rb.r + self.obstacles_list.max_step)
+        return range(len(self.positions_before))
+
     @abstractmethod
     def decisionMaking(self, rb):
         pass
@@ -26,9 +35,9 @@ class DecisionMaking(ABC):
 class OnlyReplanDecision(DecisionMaking):
     def decisionMaking(self, rb):
         decision = "No"
-        for i in range(len(self.obstacles_list_before)):
-            x1 = self.obstacles_list_before[i].x
-            y1 = self.obstacles_list_before[i].y
+        for i in self.nearby(rb):
+            x1 = self.positions_before.x[i]
+            y1 = self.positions_before.y[i]
 
             rb_next = rb.nextPosition(self.goal)
 
@@ -192,15 +201,16 @@ class FuzzyDecisionMaking(DecisionMaking):
 
     def decisionMaking(self, rb):
         decision = "No"
-        for i in range(len(self.obstacles_list_before)):
-            x1 = self.obstacles_list_before[i].x
-            y1 = self.obstacles_list_before[i].y
-            x2 = self.obstacles_list_after[i].x
-            y2 = self.obstacles_list_after[i].y
+        for i in self.nearby(rb):
+            obstacle = self.obstacles_list[i]
+            x1 = self.positions_before.x[i]
+            y1 = self.positions_before.y[i]
+            x2 = obstacle.x
+            y2 = obstacle.y
             if x1 == x2 and y1 == y2: continue
-            x1, y1 = min(self.obstacles_list_before[i].get_corners(),
+            x1, y1 = min(corners(x1, y1, obstacle.width, obstacle.height),
                          key=lambda x: (rb.pos[0] - x[0]) ** 2 + (rb.pos[1] - x[1]) ** 2)
-            x2, y2 = min(self.obstacles_list_after[i].get_corners(),
+            x2, y2 = min(obstacle.get_corners(),
                          key=lambda x: (rb.pos[0] - x[0]) ** 2 + (rb.pos[1] - x[1]) ** 2)
             distance = np.sqrt((rb.pos[0] - x1) * (rb.pos[0] - x1) + (rb.pos[1] - y1) * (rb.pos[1] - y1))
             if distance < rb.r:
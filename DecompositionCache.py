@@ -0,0 +1,43 @@
+import hashlib
+import os
+import tempfile
+import numpy as np
+from AABB import obstacle_bounds
+
+# Bump when the decomposition rules or the stored arrays change, so that old entries are not reused
+VERSION = 1
+
+
+# On-disk cache of quadtree decompositions of static obstacles: one .npz per key with the leaf table (Morton
+# codes, depths, values and percentages of the leaves in Z-order) and the neighbor table (owner / neighbor
+# index pairs as returned by Morton.adjacency). Entries are written to a temporary file and renamed, so
+# parallel workers can share a directory
+class DecompositionCache:
+    def __init__(self, directory='cache'):
+        self.directory = directory
+
+    # Hash of the obstacles' extents and of every parameter that changes the decomposition
+    @staticmethod
+    def key(obstacles, *parameters):
+        top_left, bottom_right = obstacle_bounds(obstacles)
+        digest = hashlib.sha256(repr((VERSION,) + parameters).encode())
+        digest.update(np.ascontiguousarray(top_left, dtype=float).tobytes())
+        digest.update(np.ascontiguousarray(bottom_right, dtype=float).tobytes())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    # Dict of the stored arrays, or None on a miss
+    def load(self, key):
+        try:
+            with np.load(self.path(key)) as entry:
+                return {name: entry[name] for name in entry.files}
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key, **arrays):
+        os.makedirs(self.directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.npz', delete=False) as f:
+            np.savez(f, **arrays)
+        os.replace(f.name, self.path(key))
@@ -1,6 +1,10 @@
+import math
+import sys
 from abc import ABC, abstractmethod
 import numpy as np
-from AABB import Node
+import Morton
+from AABB import AABB, Node, obstacle_bounds, split_static
+from Occupancy import OccupancyGrid, BitOccupancyGrid, finest_depth
 from itertools import chain
 
 
@@ -10,6 +14,35 @@ def my_iter(iterable):
     return iterable
 
 
+# Set node.neighbors from (leaf, neighbor) index pairs grouped by leaf, as returned by Morton.adjacency
+def link_neighbors(nodes, owners, neighbors):
+    bounds = np.searchsorted(owners, np.arange(len(nodes) + 1)).tolist()
+    neighbors = neighbors.tolist()
+    for i, node in enumerate(nodes):
+        node.neighbors = [nodes[j] for j in neighbors[bounds[i]:bounds[i + 1]]]
+
+
+# Set node.h, the straight-line distance from the node's centre to the goal's, for all nodes in one pass
+def set_heuristic(nodes, goal):
+    x = np.fromiter((node.x for node in nodes), float, len(nodes))
+    y = np.fromiter((node.y for node in nodes), float, len(nodes))
+    for node, h in zip(nodes, np.sqrt(np.square(x - goal.x) + np.square(y - goal.y)).tolist()):
+        node.h = h
+
+
+# Morton keys at the finest leaf depth, depths and that depth for the leaves of a pointer quadtree
+def leaf_table(root, leaves):
+    width = np.array([leaf.width for leaf in leaves])
+    left = np.array([leaf.x - leaf.width / 2 for leaf in leaves])
+    top = np.array([leaf.y - leaf.height / 2 for leaf in leaves])
+    depths = np.rint(np.log2(root.width / width)).astype(np.int64)
+    max_depth = int(depths.max())
+    cell_width, cell_height = root.width / 2 ** max_depth, root.height / 2 ** max_depth
+    ix = np.rint((left - (root.x - root.width / 2)) / cell_width).astype(np.int64)
+    iy = np.rint((top - (root.y - root.height / 2)) / cell_height).astype(np.int64)
+    return Morton.encode(ix, iy), depths, max_depth
+
+
 class Environment(ABC):
     def __init__(self, x, y, env_width, env_height):
         self.root = Node(x, y, env_width, env_height)
@@ -26,6 +59,36 @@ class Environment(ABC):
     def build_env(self, start, goal):
         pass
 
+    # Every node object the environment keeps alive, not only the ones the solver walks
+    def all_nodes(self):
+        return my_iter(self.nodes) if self.nodes else []
+
+    # Set node.h for the solvers that order their search by it (see AStarSolver); D* Lite keys its queue on the
+    # robot's position instead, so building or refreshing the graph leaves h alone
+    def compute_heuristic(self):
+        set_heuristic(self.nodes, self.goal)
+
+    # Size of the planning graph, for sizing deployments: graph nodes, directed neighbor edges, nodes kept in
+    # total (e.g. internal quadtree nodes) and bytes. Bytes cover each node, its neighbor list, key and float
+    # attributes, counting objects shared between nodes (np.inf, cached ints) once
+    def memory_report(self):
+        graph = list(my_iter(self.nodes)) if self.nodes else []
+        seen = set()
+        size = 0
+        count = 0
+        for node in self.all_nodes():
+            count += 1
+            for item in (node, node.neighbors, node.key, node.x, node.y, node.width, node.height, node.h, node.g,
+                         node.rhs, node.percentage, node.static_percentage):
+                if id(item) not in seen:
+                    seen.add(id(item))
+                    size += sys.getsizeof(item)
+        return {'nodes': len(graph),
+                'edges': sum(len(node.neighbors) for node in graph),
+                'total_nodes': count,
+                'bytes': size,
+                'bytes_per_node': size / max(len(graph), 1)}
+
     def draw(self, window, mode="full"):
         if mode == 'full':
             # self.current.draw(window)
@@ -47,34 +110,229 @@ class Environment(ABC):
             return
 
 
+# The obstacles are kept in two layers: static obstacles are intersected with a node once and their share is
+# kept in the node (Node.layered_covering), dynamic obstacles are intersected on every update / refresh. With
+# a cache, the decomposition of the static layer is loaded from disk and only the dynamic obstacles are
+# overlaid on it
 class QuadTreeEnvironment(Environment):
-    def __init__(self, x, y, env_width, env_height):
+    # occupancy: decompose from an OccupancyGrid (summed-area table of the rasterized obstacles) instead of
+    # summing obstacle / node intersections; no layers, every update redraws the raster. 'packed' for a
+    # BitOccupancyGrid
+    # cache: DecompositionCache that decompositions of the static obstacles are loaded from / saved to
+    def __init__(self, x, y, env_width, env_height, occupancy=False, threshold_percentage=0.005, threshold_size=16,
+                 cache=None):
         super().__init__(x, y, env_width, env_height)
         self.nodes = [self.root]
+        self.threshold_percentage = threshold_percentage
+        self.threshold_size = threshold_size
+        self.cache = cache
+        # (owner, neighbor) index pairs over the leaves in Z-order, from Morton.adjacency or the cache
+        self.adjacency = None
+        # Leaves the pairs are numbered over, when update_region has changed the tree since (see relink)
+        self.adjacency_leaves = None
+        # Obstacle corners the tree was last decomposed for, compared against by refresh
+        self.bounds = None
+        # Static layer of the last update
+        self.static = []
+        # Optional AABB.Focus: full resolution only near the robot / path, set before update
+        self.focus = None
+        self.occupancy = None
+        if occupancy:
+            raster = BitOccupancyGrid if occupancy == 'packed' else OccupancyGrid
+            self.occupancy = raster(x - env_width / 2, y - env_height / 2, env_width, env_height,
+                                    finest_depth(env_width, env_height, threshold_size))
 
     def update(self, obstacles):
-        self.root.update_percentage_and_split(obstacles)
+        self.bounds = tuple(np.array(b) for b in obstacle_bounds(obstacles))
+        self.static, dynamic = split_static(obstacles)
+        if self.cache is None or self.focus is not None or (self.occupancy is not None and len(dynamic)):
+            self.decompose(obstacles)
+            return
+        key = self.cache.key(self.static, self.root.x, self.root.y, self.root.width, self.root.height,
+                             self.threshold_percentage, self.threshold_size,
+                             None if self.occupancy is None else type(self.occupancy).__name__)
+        table = self.cache.load(key)
+        if table is not None:
+            self.restore(table)
+        else:
+            self.decompose(self.static)
+            self.cache.save(key, **self.table())
+        if len(dynamic):
+            # Overlay the dynamic layer where it covers the static decomposition
+            top_left, bottom_right = obstacle_bounds(dynamic)
+            regions = np.hstack([top_left, bottom_right])[:, [0, 2, 1, 3]]
+            self.adjacency_leaves = self.root.get_leaves()
+            self.root.update_region(dynamic, regions, [], [], [], self.threshold_percentage, self.threshold_size,
+                                    static=self.static)
 
-    def build_env(self, start, goal):
-        nodes = []
+    def decompose(self, obstacles):
+        if self.occupancy is not None:
+            self.occupancy.rasterize(obstacles)
+            self.root.update_from_occupancy(self.occupancy, 0, 0, self.occupancy.size, self.occupancy.size,
+                                            self.threshold_percentage, self.threshold_size, self.focus)
+        else:
+            static, dynamic = split_static(obstacles)
+            self.root.update_percentage_and_split(dynamic, self.threshold_percentage, self.threshold_size,
+                                                  self.focus, static)
+        self.adjacency = self.adjacency_leaves = None
+
+    # Leaf and neighbor tables of the current tree, as stored by DecompositionCache
+    def table(self):
+        leaves = self.root.get_leaves()
+        keys, depths, max_depth = leaf_table(self.root, leaves)
+        self.adjacency = Morton.adjacency(keys, depths, max_depth)
+        self.adjacency_leaves = None
+        return {'codes': Morton.ascend(keys, depths, max_depth),
+                'depths': depths,
+                'values': np.array([leaf.value for leaf in leaves], dtype=np.int8),
+                'percentages': np.array([leaf.percentage for leaf in leaves]),
+                'owners': self.adjacency[0],
+                'neighbors': self.adjacency[1]}
+
+    # Rebuild the tree from a table(): every leaf is reached from the root by its Morton code, two bits per
+    # level, splitting on the way
+    def restore(self, table):
+        self.root = Node(self.root.x, self.root.y, self.root.width, self.root.height)
+        for code, depth, value, percentage in zip(table['codes'].tolist(), table['depths'].tolist(),
+                                                  table['values'].tolist(), table['percentages'].tolist()):
+            node = self.root
+            for shift in range(2 * depth - 2, -1, -2):
+                if node.NW is None:
+                    node.split()
+                node = (node.NW, node.NE, node.SW, node.SE)[(code >> shift) & 3]
+            node.value = value
+            node.percentage = node.static_percentage = percentage
+        self.adjacency = table['owners'], table['neighbors']
+        self.adjacency_leaves = None
+
+    # Bring an already built environment up to date with obstacles that moved since the last update /
+    # refresh: only the subtrees under their old and new extents are re-split or merged, and only leaves
+    # next to those get new neighbor lists. Static obstacles never move, so only the dynamic layer is
+    # intersected again. touched: leaves whose value was changed outside the tree (e.g. by
+    # DStarLiteSolver.replan_path), which are recomputed as well. With a focus, so are the unknown leaves it
+    # has moved over (see focused_unknown). Returns the leaves that left the tree and the new or changed
+    # leaves, for the solver. Search state (g, rhs, key) is left as is, see reset_search
+    def refresh(self, obstacles, start, goal, touched=()):
+        top_left, bottom_right = (np.array(b) for b in obstacle_bounds(obstacles))
+        if self.bounds is None or self.bounds[0].shape != top_left.shape or self.occupancy is not None:
+            # Obstacles added or removed, or a raster to redraw anyway: decompose from scratch
+            removed = self.nodes
+            self.root = Node(self.root.x, self.root.y, self.root.width, self.root.height)
+            self.update(obstacles)
+            self.build_env(start, goal)
+            return removed, self.nodes
+        old_top_left, old_bottom_right = self.bounds
+        moved = np.any((old_top_left != top_left) | (old_bottom_right != bottom_right), axis=1)
+        corners = np.concatenate([np.hstack([old_top_left, old_bottom_right])[moved],
+                                  np.hstack([top_left, bottom_right])[moved]])
+        # (x1, x2, y1, y2) rows, as AABB.return_coordinate
+        regions = np.concatenate([corners[:, [0, 2, 1, 3]],
+                                  np.array([leaf.return_coordinate() for leaf in touched]).reshape(-1, 4),
+                                  self.focused_unknown()])
+        self.bounds = top_left, bottom_right
+        self.static, dynamic = split_static(obstacles)
+        removed, added, changed = [], [], []
+        if self.adjacency_leaves is None:
+            self.adjacency_leaves = self.nodes
+        self.root.update_region(dynamic, regions, removed, added, changed, self.threshold_percentage,
+                                self.threshold_size, static=self.static, focus=self.focus)
+        # Leaves created and merged away again within this refresh
+        gone = set(removed)
+        added = [leaf for leaf in added if leaf not in gone]
+        changed = [leaf for leaf in changed if leaf not in gone]
+
+        # Leaves whose neighbors may differ: the new ones and those that bordered a removed one. The neighbor
+        # table is brought up to date when it is needed again (see relink)
+        patch = dict.fromkeys(added)
+        for leaf in removed:
+            patch.update((neighbor, None) for neighbor in leaf.neighbors if neighbor not in gone)
+        for leaf in patch:
+            leaf.update_neighbors()
+
+        self.nodes = self.root.get_leaves()
         self.add_start(start)
         self.add_goal(goal)
-        for leaf in self.root.get_leaves():
+        self.current = self.start
+        return removed, added + changed
+
+    # Bring the neighbor table from adjacency_leaves to the current leaves. Leaves that are still there are as
+    # adjacent as before, so their pairs are kept and renumbered, and only the new leaves get new neighbor lists
+    # and pairs. Walking the tree for a leaf's neighbors costs a few times its share of the Morton table, so when
+    # much of the tree is new (a dense overlay, say) the table is recomputed instead
+    def relink(self, leaves):
+        old, self.adjacency_leaves = self.adjacency_leaves, None
+        kept = set(old)
+        new = [leaf for leaf in leaves if leaf not in kept]
+        if len(new) * 4 > len(leaves):
+            self.adjacency = Morton.adjacency(*leaf_table(self.root, leaves))
+            return
+        index = {leaf: i for i, leaf in enumerate(leaves)}
+        renumber = np.array([index.get(leaf, -1) for leaf in old], dtype=np.int64)
+        owners, neighbors = renumber[self.adjacency[0]], renumber[self.adjacency[1]]
+        keep = (owners >= 0) & (neighbors >= 0)
+        pairs = []
+        for leaf in new:
             leaf.update_neighbors()
-            nodes.append(leaf)
-            leaf.h = np.sqrt(np.square(leaf.x - self.goal.x) + np.square(leaf.y - self.goal.y))
-        self.nodes = nodes
+            i = index[leaf]
+            for neighbor in leaf.neighbors:
+                j = index[neighbor]
+                pairs.append((i, j))
+                # A new neighbor adds this pair from its own list
+                if neighbor in kept:
+                    pairs.append((j, i))
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        owners = np.concatenate([owners[keep], pairs[:, 0]])
+        neighbors = np.concatenate([neighbors[keep], pairs[:, 1]])
+        order = np.argsort(owners, kind='stable')
+        self.adjacency = owners[order], neighbors[order]
+
+    # (x1, x2, y1, y2) rows of the unknown leaves (see Node.unknown) within reach of the focus, which would be
+    # decomposed at full resolution from scratch. Leaves the focus has moved away from are left finer than it
+    # asks for: that only costs the solver a few leaves
+    def focused_unknown(self):
+        if self.focus is None:
+            return np.empty((0, 4))
+        regions = np.array([leaf.return_coordinate() for leaf in self.nodes if leaf.unknown]).reshape(-1, 4)
+        return regions[self.focus.near(regions[:, [0, 2]], regions[:, [1, 3]])]
+
+    def all_nodes(self):
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            if node.NW is not None:
+                stack += (node.SE, node.SW, node.NE, node.NW)
+
+    # Forget the previous search so that a new solver can run on the same leaves
+    def reset_search(self):
+        for node in self.nodes:
+            node.g = np.inf
+            node.rhs = np.inf
+            node.key = (np.inf, np.inf)
+
+    def build_env(self, start, goal):
+        self.add_start(start)
+        self.add_goal(goal)
+        leaves = self.root.get_leaves()
+        # All leaves' neighbors at once from their Morton keys instead of Node.update_neighbors
+        if self.adjacency is None:
+            self.adjacency = Morton.adjacency(*leaf_table(self.root, leaves))
+            self.adjacency_leaves = None
+        elif self.adjacency_leaves is not None:
+            self.relink(leaves)
+        link_neighbors(leaves, *self.adjacency)
+        self.nodes = leaves
         self.current = self.start
 
     def add_start(self, start):
         current = self.root
-        while current.get_children():
+        while current.NW is not None:
             current = current.get_quadrant(start)
         self.start = current
 
     def add_goal(self, goal):
         current = self.root
-        while current.get_children():
+        while current.NW is not None:
             current = current.get_quadrant(goal)
         self.goal = current
 
@@ -94,46 +352,182 @@ class QuadTreeEnvironment(Environment):
     #     return show_path(self)
 
 
+# Uniform grid stored as NumPy arrays: value, g and rhs of every cell, indexed (row, column) with rows along
+# y. The solvers walk GridCell views, created the first time a cell is reached, which read and write the arrays
+# and find their neighbors from index offsets, so no per-cell objects or neighbor lists are built up front.
+# Obstacles are rasterized by slicing
 class GridEnvironment(Environment):
-    def __init__(self, x, y, env_width, env_height, size=32):
+    # (row, column) offsets of the 8 neighbors, in neighbor list order
+    OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+    def __init__(self, x, y, env_width, env_height, size=32, clusters=None):
         super().__init__(x, y, env_width, env_height)
         self.size = size
+        # Optional Hierarchy.ClusterGraph: build_env then confines the search to the cells of the clusters on its
+        # abstract path (corridor, None for the whole grid)
+        self.clusters = clusters
+        self.corridor = None
         self.cell_width = env_width / size
         self.cell_height = env_height / size
         self.left_pad = x - env_width / 2
         self.north_pad = y - env_height / 2
-        self.nodes = [[Node(x + (2 * j - size + 1) * env_width / (2 * size),
-                            y + (2 * i - size + 1) * env_height / (2 * size),
-                            self.cell_width,
-                            self.cell_height) for j in range(size)] for i in range(size)]
+        self.value = np.full((size, size), -1, dtype=np.int8)
+        self.g = np.full((size, size), np.inf)
+        self.rhs = np.full((size, size), np.inf)
+        # GridCell views handed out so far, by row * size + column, so that a cell is always the same object
+        self.cells = {}
+
+    # Centre of a cell, computed as the cells of the former nested-list grid were placed
+    def center(self, row, column):
+        return (self.root.x + (2 * column - self.size + 1) * self.root.width / (2 * self.size),
+                self.root.y + (2 * row - self.size + 1) * self.root.height / (2 * self.size))
+
+    # Whether a cell is on the grid and open to the search
+    def contains(self, row, column):
+        return 0 <= row < self.size and 0 <= column < self.size and \
+            (self.corridor is None or self.corridor[row, column])
+
+    def cell(self, row, column):
+        index = row * self.size + column
+        cell = self.cells.get(index)
+        if cell is None:
+            cell = self.cells[index] = GridCell(self, row, column)
+        return cell
+
+    def all_nodes(self):
+        return self.cells.values()
+
+    # Every cell is a graph node whether or not it has a view; bytes are the arrays plus the views
+    def memory_report(self):
+        n = self.size
+        size = sys.getsizeof(self.cells) + self.value.nbytes + self.g.nbytes + self.rhs.nbytes
+        for cell in self.cells.values():
+            for item in (cell, cell.key, cell.neighbor_cells, cell.neighbor_index, cell.neighbor_distance):
+                size += sys.getsizeof(item)
+        return {'nodes': n * n,
+                'edges': 4 * (n - 1) * (2 * n - 1),
+                'total_nodes': len(self.cells),
+                'bytes': size,
+                'bytes_per_node': size / (n * n)}
 
     def update(self, obstacles):
-        for obstacle in obstacles:
-            x1, x2, y1, y2 = obstacle.return_coordinate()
-            lb_x, ub_x = int((x1 - self.left_pad) / self.cell_width), int(np.ceil((x2 - self.left_pad) / self.cell_width))
-            lb_y, ub_y = int((y1 - self.north_pad) / self.cell_height), int(np.ceil((y2 - self.north_pad) / self.cell_height))
-            for r in range(lb_y, ub_y):
-                for c in range(lb_x, ub_x):
-                    self.nodes[r][c].value = 1
+        top_left, bottom_right = obstacle_bounds(obstacles)
+        origin, cell_size = (self.left_pad, self.north_pad), (self.cell_width, self.cell_height)
+        lower = np.clip(((top_left - origin) / cell_size).astype(int), 0, self.size)
+        upper = np.clip(np.ceil((bottom_right - origin) / cell_size).astype(int), 0, self.size)
+        for (c1, r1), (c2, r2) in zip(lower.tolist(), upper.tolist()):
+            self.value[r1:r2, c1:c2] = 1
 
     def build_env(self, start, goal):
         start_x, start_y = int((start[0] - self.left_pad) / self.cell_width), int(
             (start[1] - self.north_pad) / self.cell_height)
-        self.start = self.nodes[start_y][start_x]
+        self.start = self.cell(start_y, start_x)
 
         end_x, end_y = int((goal[0] - self.left_pad) / self.cell_width), int(
             (goal[1] - self.north_pad) / self.cell_height)
-        self.goal = self.nodes[end_y][end_x]
+        self.goal = self.cell(end_y, end_x)
 
         self.current = self.start
+        self.value[self.value == -1] = 0
+        if self.clusters is not None:
+            self.clusters.update(self)
+            self.corridor = self.clusters.corridor(self.start, self.goal)
+
+    # GridCell.h is computed per cell when it is first read; only the distances to an earlier goal are dropped
+    def compute_heuristic(self):
+        for cell in self.cells.values():
+            cell.goal_distance = None
+
+    def draw(self, window, mode="full"):
+        if mode == 'full':
+            for row, column in zip(*np.nonzero(self.value == 1)):
+                self.cell(int(row), int(column)).draw(window)
+        else:
+            super().draw(window, mode)
+
+
+# Cell of a GridEnvironment, backed by its arrays like ObstacleView by an ObstacleSet. The key is kept on the
+# view, it only matters for cells in a solver's queue
+class GridCell(AABB):
+    __slots__ = ('grid', 'row', 'column', 'index', 'key', 'neighbor_cells', 'neighbor_index', 'neighbor_distance',
+                 'goal_distance')
+    # Cells are never left coarse (see Node.unknown)
+    unknown = False
+
+    def __init__(self, grid, row, column):
+        super().__init__(*grid.center(row, column), grid.cell_width, grid.cell_height)
+        self.grid = grid
+        self.row = row
+        self.column = column
+        # Flat index into the grid arrays
+        self.index = row * grid.size + column
+        self.key = (np.inf, np.inf)
+        self.neighbor_cells = None
+        # Flat indices of the neighbors and their distances, for calculate_rhs
+        self.neighbor_index = None
+        self.neighbor_distance = None
+        self.goal_distance = None
+
+    @property
+    def value(self):
+        return self.grid.value.item(self.index)
+
+    @value.setter
+    def value(self, value):
+        self.grid.value[self.row, self.column] = value
+
+    @property
+    def g(self):
+        return self.grid.g.item(self.index)
+
+    @g.setter
+    def g(self, value):
+        self.grid.g[self.row, self.column] = value
+
+    @property
+    def rhs(self):
+        return self.grid.rhs.item(self.index)
+
+    @rhs.setter
+    def rhs(self, value):
+        self.grid.rhs[self.row, self.column] = value
+
+    # Distance to the goal, computed the first time a solver asks for it rather than for the whole grid up front
+    @property
+    def h(self):
+        if self.goal_distance is None:
+            goal = self.grid.goal
+            dx, dy = self.x - goal.x, self.y - goal.y
+            self.goal_distance = math.sqrt(dx * dx + dy * dy)
+        return self.goal_distance
+
+    # Cells at the OFFSETS that lie on the grid, looked up the first time they are asked for
+    @property
+    def neighbors(self):
+        if self.neighbor_cells is None:
+            grid = self.grid
+            self.neighbor_cells = [grid.cell(self.row + dr, self.column + dc) for dr, dc in GridEnvironment.OFFSETS
+                                   if grid.contains(self.row + dr, self.column + dc)]
+        return self.neighbor_cells
+
+    # Node.calculate_rhs reading the neighbors' value and g straight from the arrays, without their views
+    def calculate_rhs(self):
+        grid = self.grid
+        if self.neighbor_index is None:
+            self.neighbor_index, self.neighbor_distance = [], []
+            for dr, dc in GridEnvironment.OFFSETS:
+                row, column = self.row + dr, self.column + dc
+                if grid.contains(row, column):
+                    x, y = grid.center(row, column)
+                    self.neighbor_index.append(row * grid.size + column)
+                    self.neighbor_distance.append(float(np.sqrt((self.x - x) ** 2 + (self.y - y) ** 2)))
+        value, g = grid.value, grid.g
+        factor = 1 + 1e-6 - min(1, value.item(self.index) * 100)
+        # cost(self, neighbor) + neighbor.g
+        ans = min(d / factor * (1 + 1e-6 - min(1, 100 * value.item(j))) + g.item(j)
+                  for j, d in zip(self.neighbor_index, self.neighbor_distance))
+        self.rhs = ans
+        return ans
 
-        for i in range(self.size):
-            for j in range(self.size):
-                node = self.nodes[i][j]
-                node.h = np.sqrt(np.square(node.x - self.goal.x) + np.square(node.y - self.goal.y))
-                if node.value == -1:
-                    node.value = 0
-                for dx, dy in ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)):
-                    n_x, n_y = i + dx, j + dy
-                    if 0 <= n_x < self.size and 0 <= n_y < self.size:
-                        node.neighbors.append(self.nodes[n_x][n_y])
+    calculate_key = Node.calculate_key
+    draw = Node.draw
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+# Vectorized AABB helpers. Boxes are given as (n, 2) arrays of centres and of (width, height)
+
+
+# Squared distance from point(s) to the closest point of every box. points is (2,) or (m, 2);
+# the result is (n,) or (m, n)
+def point_aabb_distance2(points, centers, sizes):
+    points = np.asarray(points, dtype=float)
+    offset = np.abs(points[..., None, :] - centers) - sizes / 2
+    return np.sum(np.square(np.maximum(offset, 0)), axis=-1)
+
+
+# Boxes that overlap the closed circle(s) of radius r around point(s), as a boolean (n,) or (m, n) mask
+def circle_aabb_mask(points, r, centers, sizes):
+    return point_aabb_distance2(points, centers, sizes) <= r ** 2
+
+
+# Squared distance from the segment p0-p1 to every box. Zero when the segment crosses the box,
+# otherwise the smaller of the endpoint-to-box and box-corner-to-segment distances
+def segment_aabb_distance2(p0, p1, centers, sizes):
+    p0, p1 = np.asarray(p0, dtype=float), np.asarray(p1, dtype=float)
+    d = p1 - p0
+    top_left, bottom_right = centers - sizes / 2, centers + sizes / 2
+
+    # Slab test for segments that cross a box
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1, t2 = (top_left - p0) / d, (bottom_right - p0) / d
+    parallel = d == 0
+    inside = (top_left <= p0) & (p0 <= bottom_right)
+    t_near = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2)).max(axis=1)
+    t_far = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2)).min(axis=1)
+    crossing = (t_near <= t_far) & (t_far >= 0) & (t_near <= 1)
+
+    endpoints = np.minimum(point_aabb_distance2(p0, centers, sizes), point_aabb_distance2(p1, centers, sizes))
+    corners = np.stack([top_left, np.column_stack([bottom_right[:, 0], top_left[:, 1]]),
+                        np.column_stack([top_left[:, 0], bottom_right[:, 1]]), bottom_right], axis=1)
+    length2 = np.dot(d, d)
+    t = np.clip((corners - p0) @ d / length2, 0, 1) if length2 else np.zeros(corners.shape[:2])
+    to_corners = np.sum(np.square(corners - (p0 + t[..., None] * d)), axis=-1).min(axis=1)
+    return np.where(crossing, 0, np.minimum(endpoints, to_corners))
+
+
+# Boxes hit by a disc of radius r swept from p0 to p1, as a boolean (n,) mask
+def capsule_aabb_mask(p0, p1, r, centers, sizes):
+    return segment_aabb_distance2(p0, p1, centers, sizes) <= r ** 2
@@ -0,0 +1,261 @@
+import math
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from sortedcontainers import SortedList
+from AABB import Node
+from Env import GridEnvironment
+from Solver import DStarLiteSolver
+
+# Free runs along a border at least this long get an entrance at each end instead of one in the middle
+LONG_RUN = 6
+
+
+# Node of a ClusterGraph: a free cell next to a cluster border, or the start / goal cell of a search. Edges map
+# each linked node to the cost of the path to it: the step across the border, or the shortest path inside the
+# cluster. Walked by DStarLiteSolver like a Node
+class Entrance:
+    __slots__ = ('graph', 'row', 'column', 'cluster', 'edges', 'g', 'rhs', 'key')
+    # Entrances are free cells
+    value = 0
+    unknown = False
+
+    def __init__(self, graph, row, column):
+        self.graph = graph
+        self.row = row
+        self.column = column
+        self.cluster = graph.cluster_of(row, column)
+        self.edges = {}
+        self.g = np.inf
+        self.rhs = np.inf
+        self.key = (np.inf, np.inf)
+
+    # Position in the units of the edge costs, for the solver's heuristic; relative to the grid's corner
+    @property
+    def x(self):
+        return self.column * self.graph.cell_width
+
+    @property
+    def y(self):
+        return self.row * self.graph.cell_height
+
+    @property
+    def h(self):
+        goal = self.graph.goal
+        dx = (self.column - goal.column) * self.graph.cell_width
+        dy = (self.row - goal.row) * self.graph.cell_height
+        return math.sqrt(dx * dx + dy * dy)
+
+    @property
+    def neighbors(self):
+        self.graph.connect(self.cluster)
+        return list(self.edges)
+
+    def calculate_rhs(self):
+        self.graph.connect(self.cluster)
+        self.graph.touched.append(self)
+        self.rhs = min((cost + node.g for node, cost in self.edges.items()), default=np.inf)
+        return self.rhs
+
+    calculate_key = Node.calculate_key
+
+
+# HPA* abstraction of a GridEnvironment. The grid is cut into clusters of cluster_size x cluster_size cells,
+# entrances are placed on the free runs of every border between two clusters, and the entrances of a cluster are
+# linked by their shortest path costs inside it. The graph outlives the environments it is updated from: update
+# only redoes the borders of the clusters whose cells changed, and a cluster's inner costs are recomputed the
+# first time a search reaches it after that. corridor searches the abstract graph and returns the cells of the
+# clusters on the abstract path, to which GridEnvironment then restricts the search over cells
+class ClusterGraph:
+    def __init__(self, cluster_size=8):
+        self.cluster_size = cluster_size
+        self.size = 0
+        self.count = 0
+        self.cell_width = self.cell_height = None
+        self.blocked = None
+        # Entrances by (row, column)
+        self.nodes = {}
+        # Entrances of each cluster, in insertion order
+        self.members = {}
+        # Entrance cell pairs of each border: (cluster row, cluster column, 0) is the border with the cluster to
+        # the east, (cluster row, cluster column, 1) the one with the cluster to the south
+        self.borders = {}
+        # Clusters whose inner costs are out of date
+        self.stale = set()
+        # Search state for corridor, as the environment of its solver
+        self.touched = []
+        self.current = None
+        self.goal = None
+        # Cell moves inside a cluster by cluster shape, for search
+        self.moves = {}
+
+    def cluster_of(self, row, column):
+        return row // self.cluster_size, column // self.cluster_size
+
+    # Bring the graph up to date with the cells of a GridEnvironment
+    def update(self, grid):
+        blocked = grid.value == 1
+        if self.blocked is None or self.blocked.shape != blocked.shape:
+            self.nodes, self.members, self.borders, self.moves, self.stale = {}, {}, {}, {}, set()
+            self.size, self.cell_width, self.cell_height = grid.size, grid.cell_width, grid.cell_height
+            self.count = -(-grid.size // self.cluster_size)
+            changed = [(r, c) for r in range(self.count) for c in range(self.count)]
+        else:
+            side = self.count * self.cluster_size
+            diff = np.zeros((side, side), dtype=bool)
+            diff[:self.size, :self.size] = blocked != self.blocked
+            diff = diff.reshape(self.count, self.cluster_size, self.count, self.cluster_size).any(axis=(1, 3))
+            changed = list(zip(*np.nonzero(diff)))
+            changed = [(int(r), int(c)) for r, c in changed]
+        self.blocked = blocked
+        self.stale.update(changed)
+
+        borders = dict.fromkeys(border for r, c in changed
+                                for border in ((r, c, 0), (r, c, 1), (r, c - 1, 0), (r - 1, c, 1))
+                                if border[0] >= 0 and border[1] >= 0 and
+                                border[0] + border[2] < self.count and border[1] + 1 - border[2] < self.count)
+        for border in borders:
+            old, new = self.borders.get(border, []), self.entrances(border)
+            if new == old:
+                continue
+            for a, b in old:
+                self.nodes[a].edges.pop(self.nodes[b], None)
+                self.nodes[b].edges.pop(self.nodes[a], None)
+            for a, b in new:
+                first, second = self.node(*a), self.node(*b)
+                first.edges[second] = second.edges[first] = self.cell_width if border[2] == 0 else self.cell_height
+            self.borders[border] = new
+            r, c, south = border
+            self.stale.update(((r, c), (r + south, c + 1 - south)))
+
+        # Entrances left without a border crossing
+        for cluster in self.stale:
+            for node in [node for node in self.members.get(cluster, ())
+                         if all(other.cluster == cluster for other in node.edges)]:
+                for other in node.edges:
+                    other.edges.pop(node, None)
+                del self.members[cluster][node]
+                del self.nodes[node.row, node.column]
+
+    # Entrance cell pairs of a border: one across the middle of each run of cells free on both sides, or one
+    # across each end of a long run
+    def entrances(self, border):
+        r, c, south = border
+        size = self.cluster_size
+        if south:
+            row, begin, end = (r + 1) * size, c * size, min((c + 1) * size, self.size)
+            free = ~(self.blocked[row - 1, begin:end] | self.blocked[row, begin:end])
+        else:
+            column, begin, end = (c + 1) * size, r * size, min((r + 1) * size, self.size)
+            free = ~(self.blocked[begin:end, column - 1] | self.blocked[begin:end, column])
+        bounds = np.flatnonzero(np.diff(np.concatenate(([0], free.astype(np.int8), [0])))).reshape(-1, 2)
+        pairs = []
+        for first, stop in bounds.tolist():
+            for i in (first, stop - 1) if stop - first >= LONG_RUN else ((first + stop - 1) // 2,):
+                if south:
+                    pairs.append(((row - 1, begin + i), (row, begin + i)))
+                else:
+                    pairs.append(((begin + i, column - 1), (begin + i, column)))
+        return pairs
+
+    def node(self, row, column):
+        node = self.nodes.get((row, column))
+        if node is None:
+            node = self.nodes[row, column] = Entrance(self, row, column)
+            self.members.setdefault(node.cluster, {})[node] = None
+        return node
+
+    # Link the entrances of a stale cluster by their shortest path costs inside it
+    def connect(self, cluster):
+        if cluster not in self.stale:
+            return
+        self.stale.discard(cluster)
+        members = list(self.members.get(cluster, ()))
+        for node in members:
+            for other in [other for other in node.edges if other.cluster == cluster]:
+                del node.edges[other]
+        if len(members) > 1:
+            for node, costs in zip(members, self.search(cluster, members, members).tolist()):
+                for other, cost in zip(members, costs):
+                    if other is not node and cost < np.inf:
+                        node.edges[other] = cost
+
+    # Costs of the shortest paths from each source cell to each target cell that stay inside the cluster and
+    # only enter free cells, with the cell distances of GridCell.calculate_rhs
+    def search(self, cluster, sources, targets):
+        size = self.cluster_size
+        top, left = cluster[0] * size, cluster[1] * size
+        blocked = self.blocked[top:top + size, left:left + size]
+        shape = blocked.shape
+        if shape not in self.moves:
+            height, width = shape
+            index = np.arange(height * width).reshape(shape)
+            origins, destinations, lengths = [], [], []
+            for dr, dc in GridEnvironment.OFFSETS:
+                origin = index[max(-dr, 0):height - max(dr, 0), max(-dc, 0):width - max(dc, 0)].ravel()
+                origins.append(origin)
+                destinations.append(index[max(dr, 0):height + min(dr, 0), max(dc, 0):width + min(dc, 0)].ravel())
+                lengths.append(np.full(origin.size, math.hypot(dr * self.cell_height, dc * self.cell_width)))
+            self.moves[shape] = np.concatenate(origins), np.concatenate(destinations), np.concatenate(lengths)
+        origins, destinations, lengths = self.moves[shape]
+        open_ = ~blocked.ravel()[destinations]
+        graph = csr_matrix((lengths[open_], (origins[open_], destinations[open_])), shape=(blocked.size,) * 2)
+        costs = dijkstra(graph, indices=[(node.row - top) * shape[1] + node.column - left for node in sources])
+        return costs[:, [(node.row - top) * shape[1] + node.column - left for node in targets]]
+
+    # Start or goal cell of a search: the entrance on that cell, or a temporary node linked to the entrances of
+    # its cluster (and to the other temporary node if it is in the same cluster)
+    def endpoint(self, cell, temporary):
+        node = self.nodes.get((cell.row, cell.column))
+        if node is not None:
+            return node
+        node = Entrance(self, cell.row, cell.column)
+        self.connect(node.cluster)
+        targets = list(self.members.get(node.cluster, ())) + [other for other in temporary
+                                                              if other.cluster == node.cluster]
+        if targets:
+            for other, cost in zip(targets, self.search(node.cluster, [node], targets)[0].tolist()):
+                if cost < np.inf:
+                    node.edges[other] = other.edges[node] = cost
+        temporary.append(node)
+        return node
+
+    # Boolean mask of the cells in the clusters on the cheapest abstract path from start to goal (GridCells), or
+    # None when the abstract graph has no path and the whole grid should be searched
+    def corridor(self, start, goal):
+        if start is goal:
+            return None
+        temporary = []
+        self.current = self.endpoint(start, temporary)
+        self.goal = self.endpoint(goal, temporary)
+        queue = SortedList(key=lambda x: x.key)
+        self.goal.rhs = 0
+        self.goal.calculate_key()
+        queue.add(self.goal)
+        self.touched.append(self.goal)
+        DStarLiteSolver(queue, self).compute_path()
+
+        path = None
+        if self.current.g < np.inf:
+            node, path = self.current, [self.current]
+            while node is not self.goal:
+                node = min(node.edges, key=lambda other, edges=node.edges: edges[other] + other.g)
+                if node in path:
+                    path = None
+                    break
+                path.append(node)
+
+        for node in self.touched:
+            node.g = node.rhs = np.inf
+            node.key = (np.inf, np.inf)
+        self.touched = []
+        for node in temporary:
+            for other in node.edges:
+                other.edges.pop(node, None)
+        if path is None:
+            return None
+        clusters = np.zeros((self.count, self.count), dtype=bool)
+        for node in path:
+            clusters[node.cluster] = True
+        size = self.cluster_size
+        return clusters.repeat(size, axis=0).repeat(size, axis=1)[:self.size, :self.size]
@@ -0,0 +1,145 @@
+import numpy as np
+import Morton
+from AABB import Node, obstacle_bounds
+from Env import Environment, link_neighbors
+from Occupancy import OccupancyGrid, BitOccupancyGrid, finest_depth
+
+# Stored value of an unknown leaf (see AABB.Node.unknown)
+PARTIAL = 2
+
+
+# Quadtree stored as its leaves only: Morton code, depth and value of every leaf in NumPy arrays, sorted
+# in Z-order. The decomposition is built level by level with the same rules as Node.set_value, without
+# any internal node objects. build_env creates Node objects for the leaves, which is what the solvers
+# walk. Same interface as QuadTreeEnvironment. With occupancy, coverage comes from an OccupancyGrid (a
+# BitOccupancyGrid for 'packed') and every level is pure index arithmetic on the summed-area table
+class LinearQuadTreeEnvironment(Environment):
+    def __init__(self, x, y, env_width, env_height, threshold_percentage=0.005, threshold_size=16,
+                 occupancy=False):
+        super().__init__(x, y, env_width, env_height)
+        self.left = x - env_width / 2
+        self.top = y - env_height / 2
+        self.width = env_width
+        self.height = env_height
+        self.threshold_percentage = threshold_percentage
+        self.threshold_size = threshold_size
+        self.codes = np.zeros(1, dtype=np.uint64)
+        self.depths = np.zeros(1, dtype=np.int64)
+        # 0 free, 1 blocked or PARTIAL
+        self.values = np.full(1, -1, dtype=np.int8)
+        self.max_depth = 0
+        # Leaf codes expressed at max_depth, the sort key of the leaves
+        self.keys = np.zeros(1, dtype=np.uint64)
+        self.nodes = [self.root]
+        # Optional AABB.Focus, as QuadTreeEnvironment.focus
+        self.focus = None
+        self.occupancy = None
+        if occupancy:
+            raster = BitOccupancyGrid if occupancy == 'packed' else OccupancyGrid
+            self.occupancy = raster(self.left, self.top, env_width, env_height,
+                                    finest_depth(env_width, env_height, threshold_size))
+
+    # Top-left corner and size of cells given by Morton code and depth
+    def cells(self, codes, depths):
+        ix, iy = Morton.decode(codes)
+        width, height = self.width / 2.0 ** depths, self.height / 2.0 ** depths
+        return self.left + ix * width, self.top + iy * height, width, height
+
+    # Sum over obstacles of the fraction of each cell they cover, like Node.percentage
+    @staticmethod
+    def coverage(x1, y1, width, height, top_left, bottom_right, chunk=1024):
+        percentage = np.zeros(x1.shape[0])
+        if top_left.shape[0] == 0:
+            return percentage
+        width, height = np.broadcast_to(width, x1.shape), np.broadcast_to(height, x1.shape)
+        for begin in range(0, x1.shape[0], chunk):
+            cell = slice(begin, begin + chunk)
+            overlap_x = np.minimum(x1[cell, None] + width[cell, None], bottom_right[:, 0]) - \
+                np.maximum(x1[cell, None], top_left[:, 0])
+            overlap_y = np.minimum(y1[cell, None] + height[cell, None], bottom_right[:, 1]) - \
+                np.maximum(y1[cell, None], top_left[:, 1])
+            area = np.maximum(overlap_x, 0) * np.maximum(overlap_y, 0)
+            percentage[cell] = np.sum(area / (width[cell, None] * height[cell, None]), axis=1)
+        return percentage
+
+    def update(self, obstacles):
+        top_left, bottom_right = obstacle_bounds(obstacles)
+        if self.occupancy is not None:
+            self.occupancy.rasterize(obstacles)
+        codes, depth = np.zeros(1, dtype=np.uint64), 0
+        leaf_codes, leaf_depths, leaf_values = [], [], []
+        while codes.size:
+            x1, y1, width, height = self.cells(codes, depth)
+            if self.occupancy is not None:
+                pixels = self.occupancy.size >> depth
+                ix, iy = Morton.decode(codes)
+                percentage = self.occupancy.fraction(ix * pixels, iy * pixels, pixels, pixels)
+            else:
+                percentage = self.coverage(x1, y1, width, height, top_left, bottom_right)
+            threshold_size = self.threshold_size
+            if self.focus is not None:
+                near = self.focus.near(np.column_stack([x1, y1]), np.column_stack([x1 + width, y1 + height]))
+                threshold_size = np.where(near, threshold_size, max(threshold_size, self.focus.coarse_size))
+            # Same rules as Node.set_value, cell by cell
+            small = (width <= threshold_size) | (height <= threshold_size)
+            free = percentage <= self.threshold_percentage
+            blocked = np.where(small, ~free, percentage >= 1 - self.threshold_percentage)
+            partial = small & (width > self.threshold_size) & (height > self.threshold_size) & ~free & \
+                (percentage < 1 - self.threshold_percentage)
+            values = np.where(partial, PARTIAL, np.where(blocked, 1, 0))
+            leaf = small | free | blocked
+            children = (codes[~leaf][:, None] * np.uint64(4) + np.arange(4, dtype=np.uint64)).ravel()
+            leaf_codes.append(codes[leaf])
+            leaf_depths.append(np.full(np.count_nonzero(leaf), depth))
+            leaf_values.append(values[leaf])
+            self.max_depth = depth
+            codes, depth = children, depth + 1
+        codes, depths = np.concatenate(leaf_codes), np.concatenate(leaf_depths)
+        values = np.concatenate(leaf_values).astype(np.int8)
+
+        # Collapse four sibling leaves that are all blocked, deepest first, as Node.merge_blocked
+        for depth in range(self.max_depth, 0, -1):
+            blocked = (depths == depth) & (values == 1)
+            parents, counts = np.unique(codes[blocked] >> np.uint64(2), return_counts=True)
+            parents = parents[counts == 4]
+            if parents.size:
+                merged = blocked & np.isin(codes >> np.uint64(2), parents)
+                codes = np.concatenate([codes[~merged], parents])
+                depths = np.concatenate([depths[~merged], np.full(parents.size, depth - 1)])
+                values = np.concatenate([values[~merged], np.ones(parents.size, dtype=np.int8)])
+        self.max_depth = int(depths.max())
+
+        keys = Morton.descend(codes, depths, self.max_depth)
+        order = np.argsort(keys)
+        self.codes, self.depths, self.keys, self.values = codes[order], depths[order], keys[order], values[order]
+
+    # Index of the leaf containing each point; points on a border belong to the north / west cell,
+    # as with Node.get_quadrant
+    def locate(self, points):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        n = 2 ** self.max_depth
+        ix = np.clip(np.ceil((points[:, 0] - self.left) / (self.width / n)) - 1, 0, n - 1)
+        iy = np.clip(np.ceil((points[:, 1] - self.top) / (self.height / n)) - 1, 0, n - 1)
+        return np.searchsorted(self.keys, Morton.encode(ix, iy), side='right') - 1
+
+    # Environment.memory_report plus the leaf arrays
+    def memory_report(self):
+        report = super().memory_report()
+        report['bytes'] += self.codes.nbytes + self.depths.nbytes + self.values.nbytes + self.keys.nbytes
+        report['bytes_per_node'] = report['bytes'] / max(report['nodes'], 1)
+        return report
+
+    def build_env(self, start, goal):
+        x1, y1, width, height = self.cells(self.codes, self.depths)
+        cx, cy = x1 + width / 2, y1 + height / 2
+        nodes = [Node(x, y, w, h) for x, y, w, h in zip(cx.tolist(), cy.tolist(), width.tolist(), height.tolist())]
+        for node, value in zip(nodes, self.values.tolist()):
+            node.value = 0 if value == PARTIAL else value
+            node.unknown = value == PARTIAL
+
+        link_neighbors(nodes, *Morton.adjacency(self.keys, self.depths, self.max_depth))
+
+        start_index, goal_index = self.locate([start, goal]).tolist()
+        self.start, self.goal = nodes[start_index], nodes[goal_index]
+        self.nodes = nodes
+        self.current = self.start
@@ -0,0 +1,89 @@
+import numpy as np
+
+
+# Morton (Z-order) codes of 2-D cell indices: the bits of x and y are interleaved, x in the even bits.
+# A cell at depth d has code c; its four children at depth d + 1 are 4c + {0: NW, 1: NE, 2: SW, 3: SE}
+
+
+def _spread(v):
+    v = np.asarray(v, dtype=np.uint64) & np.uint64(0xFFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def _compact(v):
+    v = np.asarray(v, dtype=np.uint64) & np.uint64(0x5555555555555555)
+    v = (v | (v >> np.uint64(1))) & np.uint64(0x3333333333333333)
+    v = (v | (v >> np.uint64(2))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v >> np.uint64(4))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v >> np.uint64(8))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v >> np.uint64(16))) & np.uint64(0x00000000FFFFFFFF)
+    return v
+
+
+def encode(ix, iy):
+    return _spread(ix) | (_spread(iy) << np.uint64(1))
+
+
+def decode(codes):
+    codes = np.asarray(codes, dtype=np.uint64)
+    return _compact(codes).astype(np.int64), _compact(codes >> np.uint64(1)).astype(np.int64)
+
+
+# Code of the same cell expressed at a deeper level (the first of its descendants in Z-order)
+def descend(codes, depths, max_depth):
+    shift = (2 * (max_depth - np.asarray(depths, dtype=np.int64))).astype(np.uint64)
+    return np.asarray(codes, dtype=np.uint64) << shift
+
+
+# Inverse of descend: codes at max_depth back to the codes of cells at the given depths
+def ascend(keys, depths, max_depth):
+    shift = (2 * (max_depth - np.asarray(depths, dtype=np.int64))).astype(np.uint64)
+    return np.asarray(keys, dtype=np.uint64) >> shift
+
+
+# Leaves that share an edge or a corner with each leaf, from a table of leaf keys (codes at max_depth) and
+# depths. Each leaf looks up, in the sorted table, the finest cell just outside each of its four corners and
+# at the start of each of its four edges. A neighbor across an edge that is larger covers that whole edge and
+# is linked both ways; smaller ones find this leaf with their own probe. Returns (leaf,
+# neighbor) index pairs grouped by leaf, each group in the order N, S, W, E, NW, NE, SW, SE and west to east
+# / north to south along an edge, like Node.update_neighbors, without duplicates
+def adjacency(keys, depths, max_depth):
+    keys = np.asarray(keys, dtype=np.uint64)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    n = 2 ** max_depth
+    ix, iy = decode(keys)
+    side = 2 ** (max_depth - np.asarray(depths, dtype=np.int64))
+    leaves = np.arange(keys.shape[0])
+
+    # Probe cells in the order N, S, W, E, NW, NE, SW, SE
+    px = np.concatenate([ix, ix, ix - 1, ix + side, ix - 1, ix + side, ix - 1, ix + side])
+    py = np.concatenate([iy - 1, iy + side, iy, iy, iy - 1, iy - 1, iy + side, iy + side])
+    owner = np.tile(leaves, 8)
+    direction = np.repeat(np.arange(8), keys.shape[0])
+    inside = (px >= 0) & (px < n) & (py >= 0) & (py < n)
+    owner, direction, px, py = owner[inside], direction[inside], px[inside], py[inside]
+    neighbor = order[np.searchsorted(sorted_keys, encode(px, py), side='right') - 1]
+
+    # Edge probes that found a smaller leaf are answered by that leaf's own probe, and one of equal size finds
+    # this leaf back. A corner probe counts only if the leaf found touches at that corner alone
+    edge = direction < 4
+    far_x = np.where(direction % 2 == 0, ix[neighbor] + side[neighbor] - 1, ix[neighbor])
+    far_y = np.where(direction < 6, iy[neighbor] + side[neighbor] - 1, iy[neighbor])
+    keep = np.where(edge, side[neighbor] >= side[owner], (far_x == px) & (far_y == py))
+    owner, direction, neighbor = owner[keep], direction[keep], neighbor[keep]
+    larger = (direction < 4) & (side[neighbor] > side[owner])
+    opposite = np.array([1, 0, 3, 2, 7, 6, 5, 4])
+    owner, neighbor, direction = (np.concatenate([owner, neighbor[larger]]),
+                                  np.concatenate([neighbor, owner[larger]]),
+                                  np.concatenate([direction, opposite[direction[larger]]]))
+    # Position of the neighbor along the edge: x for north / south, y for west / east
+    offset = np.where(direction < 2, ix[neighbor], np.where(direction < 4, iy[neighbor], 0))
+
+    pair_order = np.argsort((owner * 8 + direction) * n + offset)
+    return owner[pair_order], neighbor[pair_order]
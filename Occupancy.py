@@ -0,0 +1,121 @@
+import numpy as np
+from AABB import obstacle_bounds
+
+
+# Quadtree depth at which Node.set_value stops splitting: cells no larger than threshold_size
+def finest_depth(width, height, threshold_size=16):
+    depth = 0
+    while width > threshold_size and height > threshold_size:
+        width, height, depth = width / 2, height / 2, depth + 1
+    return depth
+
+
+# Occupancy raster of a rectangular world with a summed-area table, so that the occupied fraction of any
+# quadtree cell is four lookups. Every cell of the finest quadtree depth is subdivision x subdivision pixels,
+# which makes quadtree cells exact pixel ranges. A pixel holds the fraction of it covered by obstacles,
+# capped at 1: overlapping obstacles are not counted twice, unlike Node.percentage. Coverage inside a pixel
+# is exact, so the subdivision only limits how finely overlaps between obstacles are resolved
+class OccupancyGrid:
+    def __init__(self, left, top, width, height, depth, subdivision=4):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.size = 2 ** depth * subdivision
+        self.pixel_width = width / self.size
+        self.pixel_height = height / self.size
+        self.sat = np.zeros((self.size + 1, self.size + 1))
+
+    # Pixel steps of the half-plane left of (above) coordinate a, as a difference array: the covered fraction
+    # of pixel c is the prefix sum of the weights up to c. Three (index, weight) deposits per coordinate
+    def steps(self, a, origin, pixel):
+        t = np.clip((a - origin) / pixel, 0, self.size)
+        k = np.minimum(np.floor(t), self.size - 1).astype(int)
+        f = t - k
+        return np.stack([np.zeros_like(k), k, k + 1], axis=1), np.stack([np.ones_like(f), f - 1, -f], axis=1)
+
+    # Rasterize all obstacles at once. A box is the signed sum of the quadrants below-right of its four
+    # corners, and a quadrant is the outer product of two step functions, so the whole raster is one
+    # scatter of 4 x 3 x 3 weights per box into a difference array followed by two prefix sums
+    def rasterize(self, obstacles):
+        top_left, bottom_right = obstacle_bounds(obstacles)
+        (x1, w1), (x2, w2) = (self.steps(top_left[:, 0], self.left, self.pixel_width),
+                              self.steps(bottom_right[:, 0], self.left, self.pixel_width))
+        (y1, v1), (y2, v2) = (self.steps(top_left[:, 1], self.top, self.pixel_height),
+                              self.steps(bottom_right[:, 1], self.top, self.pixel_height))
+        rows, columns, weights = [], [], []
+        for (y, v), (x, w), sign in (((y2, v2), (x2, w2), 1), ((y2, v2), (x1, w1), -1),
+                                     ((y1, v1), (x2, w2), -1), ((y1, v1), (x1, w1), 1)):
+            rows.append(np.broadcast_to(y[:, :, None], (y.shape[0], 3, 3)).ravel())
+            columns.append(np.broadcast_to(x[:, None, :], (x.shape[0], 3, 3)).ravel())
+            weights.append((sign * v[:, :, None] * w[:, None, :]).ravel())
+        side = self.size + 1
+        difference = np.bincount(np.concatenate(rows) * side + np.concatenate(columns), np.concatenate(weights),
+                                 minlength=side * side).reshape(side, side)
+        occupancy = np.clip(np.cumsum(np.cumsum(difference, axis=0), axis=1)[:-1, :-1], 0, 1)
+        self.sat = np.zeros((side, side))
+        np.cumsum(np.cumsum(occupancy, axis=0), axis=1, out=self.sat[1:, 1:])
+
+    # Occupied fraction of pixel blocks with top-left pixel (x1, y1) and size (w, h); works on arrays
+    def fraction(self, x1, y1, w, h):
+        sat = self.sat
+        return (sat[y1 + h, x1 + w] - sat[y1, x1 + w] - sat[y1 + h, x1] + sat[y1, x1]) / (w * h)
+
+
+# Number of set bits of every byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+# Occupancy raster stored as a bitset, one bit per pixel packed eight to a byte along rows, for worlds where
+# the float raster of OccupancyGrid does not fit: 16k x 16k pixels take 32 MB. A pixel is set when an
+# obstacle overlaps it at all, so coverage is rounded up to whole pixels. subdivision is a multiple of 8, so
+# that every row of a finest quadtree cell is whole bytes; the number of set pixels of each finest cell is
+# counted by byte popcounts and kept as a summed-area table, which answers fraction for any quadtree cell
+class BitOccupancyGrid:
+    def __init__(self, left, top, width, height, depth, subdivision=8):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.subdivision = subdivision
+        self.size = 2 ** depth * subdivision
+        self.pixel_width = width / self.size
+        self.pixel_height = height / self.size
+        self.bits = np.zeros((self.size, self.size // 8), dtype=np.uint8)
+        self.counts = np.zeros((2 ** depth + 1, 2 ** depth + 1), dtype=np.int64)
+
+    # Set the pixels of every obstacle, one slice per obstacle over the bytes of its rows: the partial bytes at
+    # both ends are masked, the ones between are filled
+    def rasterize(self, obstacles):
+        top_left, bottom_right = obstacle_bounds(obstacles)
+        x1 = np.floor((top_left[:, 0] - self.left) / self.pixel_width)
+        x2 = np.ceil((bottom_right[:, 0] - self.left) / self.pixel_width)
+        y1 = np.floor((top_left[:, 1] - self.top) / self.pixel_height)
+        y2 = np.ceil((bottom_right[:, 1] - self.top) / self.pixel_height)
+        bounds = np.clip(np.column_stack([x1, x2, y1, y2]), 0, self.size).astype(int)
+        self.bits[:] = 0
+        for c1, c2, r1, r2 in bounds.tolist():
+            if c1 >= c2 or r1 >= r2:
+                continue
+            first, last = c1 >> 3, (c2 - 1) >> 3
+            head, tail = 0xFF >> (c1 & 7), (0xFF << (7 - ((c2 - 1) & 7))) & 0xFF
+            if first == last:
+                self.bits[r1:r2, first] |= head & tail
+            else:
+                self.bits[r1:r2, first] |= head
+                self.bits[r1:r2, first + 1:last] = 0xFF
+                self.bits[r1:r2, last] |= tail
+        cells, step = 2 ** self.depth, self.subdivision
+        counts = POPCOUNT[self.bits].reshape(cells, step, cells, step // 8).sum(axis=(1, 3))
+        np.cumsum(np.cumsum(counts, axis=0), axis=1, out=self.counts[1:, 1:])
+
+    # Occupied fraction of pixel blocks with top-left pixel (x1, y1) and size (w, h), as OccupancyGrid.fraction;
+    # the blocks must be made of finest quadtree cells, as every quadtree cell is. Works on arrays
+    def fraction(self, x1, y1, w, h):
+        step = self.subdivision
+        x1, y1, w, h = x1 // step, y1 // step, w // step, h // step
+        counts = self.counts
+        return (counts[y1 + h, x1 + w] - counts[y1, x1 + w] - counts[y1 + h, x1] + counts[y1, x1]) / \
+            (w * h * step * step)
@@ -6,12 +6,19 @@ import numpy as np
 from pygame.locals import *
 from sortedcontainers import SortedList
 from Env import QuadTreeEnvironment, GridEnvironment
+from LinearQuadTree import LinearQuadTreeEnvironment
 from robot import Robot
 from PathManipulation import makeSpline, drawSpline, draw_path, draw_target, draw_start
 from Colors import *
 from Solver import DStarLiteSolver, AStarSolver
 from DecisionMaking import FuzzyDecisionMaking, OnlyReplanDecision
 from Obstacles import Obstacle, maps
+from AABB import PositionSnapshot, ObstacleSet, Focus
+from Clock import SimulationClock, TICK
+from Telemetry import TelemetryWriter
+from Trajectory import TrajectoryRecorder
+from DecompositionCache import DecompositionCache
+from Hierarchy import ClusterGraph
 
 # env_width = int(input("Enter width: "))
 # env_height = int(input("Enter height: "))
@@ -31,23 +38,110 @@ def get_modules(algorithm):
     return env_type, planning_algo, decision_algo
 
 
-def main(algorithm, scenario, test_map, interactive=True):
+# headless: no display surface, no drawing and no frame delay, only the planning / decision pipeline
+# action_path / result_path: override the default action/<scenario>/<algorithm> and result/<scenario>/<algorithm>
+# binary_telemetry: also write phase timings as binary records to <action_path>.bin
+# trajectory_path: record every obstacle position of the run to this file (see Trajectory.load_trajectory)
+# linear_quadtree: use the Morton-coded LinearQuadTreeEnvironment
+# occupancy_raster: decompose the quadtree from a summed-area table of the rasterized obstacles; 'packed' keeps
+# the raster as a bitset (BitOccupancyGrid)
+# focus_radius: decompose the quadtree at full resolution only within this distance of the robot, the goal and
+# the previous path, and down to focus_coarse_size elsewhere
+# decomposition_cache: directory of cached quadtree decompositions of static maps (see DecompositionCache)
+# grid_size: number of cells along each side of the grid environment
+# grid_clusters: plan on the grid hierarchically, through clusters of this many cells a side (see ClusterGraph)
+# max_ticks: give up (and record a Fail) once the simulation has run this many ticks
+# robot_footprint: radius of the robot's body, swept along its motion for the collision check; the default 0 is a
+# point robot, as the planners assume
+# dt: simulated seconds per tick; phase timings are planner wall time, the reported run time is simulated time
+def main(algorithm, scenario, test_map, interactive=True, headless=False, action_path=None, result_path=None,
+         binary_telemetry=False, trajectory_path=None, linear_quadtree=False, max_ticks=None,
+         dt=TICK, occupancy_raster=False, focus_radius=None, focus_coarse_size=64,
+         decomposition_cache=None, grid_size=32, grid_clusters=None, robot_footprint=0):
+    # The start, the goal, Obstacles.maps and the robot's sensing and decision thresholds are all laid out for
+    # this world; larger worlds are only available through the environment classes
     env_width = env_height = 512
+    if action_path is None:
+        action_path = 'action/' + scenario + '/' + algorithm
+    if result_path is None:
+        result_path = 'result/' + scenario + '/' + algorithm
+    if headless:
+        interactive = False
     # Pygame setup
     NORTH_PAD, SOUTH_PAD, LEFT_PAD, RIGHT_PAD = (int(env_height * 0.06), int(env_height * 0.16),
                                                  int(env_width * 0.06), int(env_width * 0.06))
     SCREEN_WIDTH = env_width + LEFT_PAD + RIGHT_PAD
     SCREEN_HEIGHT = env_height + NORTH_PAD + SOUTH_PAD
-    pygame.init()
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), 0, 32)
-    pygame.display.set_caption("Quadtree Simulation")
-    my_font = pygame.font.SysFont(None, SOUTH_PAD // 4)
-    PATIENCE = 30
+    screen = None
+    if not headless:
+        pygame.init()
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), 0, 32)
+        pygame.display.set_caption("Quadtree Simulation")
+        my_font = pygame.font.SysFont(None, SOUTH_PAD // 4)
+    # Simulated seconds between two global plannings
+    REPLAN_PERIOD = 30 * TICK
+    # Spline samples the robot advances per tick: 200 per TICK, so that its speed relative to the obstacles
+    # does not depend on dt
+    STEP = 200 * dt / TICK
 
     # Modules
     env_type, planning_algo, decision_algo = get_modules(algorithm)
     print('Using:', env_type, planning_algo, decision_algo)
 
+    cache = DecompositionCache(decomposition_cache) if decomposition_cache is not None else None
+    # Kept across plans, so that only the clusters obstacles moved through are redone
+    clusters = ClusterGraph(grid_clusters) if grid_clusters is not None else None
+
+    # Choose env type
+    def make_env():
+        if env_type == 'grid':
+            return GridEnvironment(LEFT_PAD + env_width / 2, NORTH_PAD + env_height / 2, env_width, env_height,
+                                   grid_size, clusters)
+        if linear_quadtree:
+            return LinearQuadTreeEnvironment(LEFT_PAD + env_width / 2, NORTH_PAD + env_height / 2,
+                                             env_width, env_height, occupancy=occupancy_raster)
+        return QuadTreeEnvironment(LEFT_PAD + env_width / 2, NORTH_PAD + env_height / 2, env_width, env_height,
+                                   occupancy=occupancy_raster, cache=cache)
+
+    # Decomposition for a search. The quadtree is kept and only refreshed where dynamic obstacles moved, where
+    # D* Lite sensed changes and where the focus reaches leaves it left coarse. A star searches from scratch
+    # every time; D* Lite repairs its search over the removed and changed leaves, and only starts over when the
+    # goal leaf changed or leaves on its path were refined, which changes the cost of everything behind them.
+    # Returns the environment and whether the current solver was kept. refined: further points to decompose at
+    # full resolution around
+    def decompose(refined=()):
+        focus = None
+        if focus_radius is not None:
+            points = [robot.pos, end] + [(node.x, node.y) for node in path or []] + list(refined)
+            focus = Focus(points, focus_radius, focus_coarse_size)
+        dstar = isinstance(robot.solver, DStarLiteSolver)
+        if isinstance(env, QuadTreeEnvironment) and (planning_algo == 'Astar' or dstar):
+            env.focus = focus
+            goal = env.goal
+            removed, changed = env.refresh(obstacles_list, robot.pos, end, robot.solver.sensed if dstar else ())
+            if dstar:
+                robot.solver.sensed.clear()
+                if env.goal is goal and not refined:
+                    robot.solver.repair(removed, changed)
+                    return env, True
+            env.reset_search()
+            return env, False
+        new_env = make_env()
+        if env_type != 'grid':
+            new_env.focus = focus
+        new_env.update(obstacles_list)
+        new_env.build_env(robot.pos, end)
+        return new_env, False
+
+    # Leaves of a path that the focus left coarse while obstacles only partly cover them (Node.unknown)
+    def coarse_leaves(path):
+        return [node for node in path or [] if node.unknown]
+
+    # Point of the spline the robot heads for after the given number of ticks, or the goal past its end
+    def spline_target(spl, targets):
+        index = round(targets * STEP)
+        return tuple(spl[:, index]) if index < spl.shape[1] else end
+
     # Initialization
     begin = (64, 500)
     end = (470, 180)
@@ -56,9 +150,8 @@ def main(algorithm, scenario, test_map, interactive=True):
     done = False
     finished = False
     isStatic = True
-    obstacles_list = []
+    obstacles_list = ObstacleSet()
     pause = False
-    patience = 0
     env = None
     path = None
     past_path = []
@@ -66,230 +159,232 @@ def main(algorithm, scenario, test_map, interactive=True):
     spl = None
     targets = 0
     collision = False
-    start_time = None
+    timeout = False
+    clock = SimulationClock(dt)
+    positions_before = PositionSnapshot()
+    telemetry = TelemetryWriter(action_path, test_map, action_path + '.bin' if binary_telemetry else None)
+    trajectory = TrajectoryRecorder(trajectory_path) if trajectory_path is not None else None
 
     # Auto run
     if not interactive:
         if test_map in maps:
-            obstacles_list = maps[test_map]
+            obstacles_list = ObstacleSet(maps[test_map])
         done = True
 
-    robot = Robot(begin, None, OnlyReplanDecision() if decision_algo == "OnlyReplan" else FuzzyDecisionMaking())
-
-    while not finished:
-
-        screen.fill(WHITE)
-        if interactive:
-            # Button
-            button1 = pygame.draw.rect(screen, BLACK, (LEFT_PAD + int(env_width * 0.1), NORTH_PAD * 2 + env_height,
-                                                       int(env_width * 0.2), int(SOUTH_PAD * 0.4)), 4)
-            button1_text = my_font.render("Start", True, (0, 0, 0))
-            button1_rect = button1_text.get_rect(center=button1.center)
-            screen.blit(button1_text, button1_rect)
-
-            button2 = pygame.draw.rect(screen, BLACK, (LEFT_PAD + int(env_width * 0.7), NORTH_PAD * 2 + env_height,
-                                                       int(env_width * 0.2), int(SOUTH_PAD * 0.4)), 4)
-            button2_text = my_font.render("Pause", True, (0, 0, 0))
-            button2_rect = button2_text.get_rect(center=button2.center)
-            screen.blit(button2_text, button2_rect)
-
-            button3 = pygame.draw.rect(screen,
-                                       BLACK,
-                                       (LEFT_PAD + int(env_width * 0.4),
-                                        NORTH_PAD * 2 + env_height,
-                                        int(env_width * 0.2),
-                                        int(SOUTH_PAD * 0.4)),
-                                       4)
-            button3_text = my_font.render("Static", True, (0, 0, 0))
-            button3_rect = button3_text.get_rect(center=button3.center)
-            screen.blit(button3_text, button3_rect)
-
-            for event in pygame.event.get():
-                if event.type == QUIT:
-                    pygame.quit()
-                    sys.exit()
-                if event.type == MOUSEBUTTONDOWN:
-                    mouse_x, mouse_y = event.pos
-                    if button1.collidepoint(mouse_x, mouse_y):
-                        done = True
-                        with open("Obstacles.py", 'a') as f:
-                            f.write(",\n".join([o.__str__() for o in obstacles_list]))
-                        if test_map in maps:
-                            obstacles_list = maps[test_map]
-                    elif button2.collidepoint(mouse_x, mouse_y):
-                        pause = not pause
-                    elif button3.collidepoint(mouse_x, mouse_y):
-                        isStatic = not isStatic
-                        if isStatic:
-                            print("Static")
+    robot = Robot(begin, None, OnlyReplanDecision() if decision_algo == "OnlyReplan" else FuzzyDecisionMaking(),
+                  footprint=robot_footprint)
+    local_goal = robot.pos
+
+    # Flush the buffered telemetry and trajectory even when the run raises or is interrupted
+    try:
+        while not finished:
+
+            if not headless:
+                screen.fill(WHITE)
+            if interactive:
+                # Button
+                button1 = pygame.draw.rect(screen, BLACK, (LEFT_PAD + int(env_width * 0.1), NORTH_PAD * 2 + env_height,
+                                                           int(env_width * 0.2), int(SOUTH_PAD * 0.4)), 4)
+                button1_text = my_font.render("Start", True, (0, 0, 0))
+                button1_rect = button1_text.get_rect(center=button1.center)
+                screen.blit(button1_text, button1_rect)
+
+                button2 = pygame.draw.rect(screen, BLACK, (LEFT_PAD + int(env_width * 0.7), NORTH_PAD * 2 + env_height,
+                                                           int(env_width * 0.2), int(SOUTH_PAD * 0.4)), 4)
+                button2_text = my_font.render("Pause", True, (0, 0, 0))
+                button2_rect = button2_text.get_rect(center=button2.center)
+                screen.blit(button2_text, button2_rect)
+
+                button3 = pygame.draw.rect(screen,
+                                           BLACK,
+                                           (LEFT_PAD + int(env_width * 0.4),
+                                            NORTH_PAD * 2 + env_height,
+                                            int(env_width * 0.2),
+                                            int(SOUTH_PAD * 0.4)),
+                                           4)
+                button3_text = my_font.render("Static", True, (0, 0, 0))
+                button3_rect = button3_text.get_rect(center=button3.center)
+                screen.blit(button3_text, button3_rect)
+
+                for event in pygame.event.get():
+                    if event.type == QUIT:
+                        pygame.quit()
+                        sys.exit()
+                    if event.type == MOUSEBUTTONDOWN:
+                        mouse_x, mouse_y = event.pos
+                        if button1.collidepoint(mouse_x, mouse_y):
+                            done = True
+                            with open("Obstacles.py", 'a') as f:
+                                f.write(",\n".join([o.__str__() for o in obstacles_list]))
+                            if test_map in maps:
+                                obstacles_list = ObstacleSet(maps[test_map])
+                        elif button2.collidepoint(mouse_x, mouse_y):
+                            pause = not pause
+                        elif button3.collidepoint(mouse_x, mouse_y):
+                            isStatic = not isStatic
+                            if isStatic:
+                                print("Static")
+                            else:
+                                print("Dynamic")
                         else:
-                            print("Dynamic")
-                    else:
-                        mx, my = mouse_x, mouse_y
-                        drawing = True
-                        done = False
-                if event.type == MOUSEBUTTONUP:
-                    if drawing:
-                        new_mx, new_my = event.pos
-                        new_obstacle = Obstacle((mx+new_mx)/2,
-                                                (my+new_my)/2,
-                                                abs(new_mx-mx),
-                                                abs(new_my-my),
-                                                isStatic,
-                                                np.random.randn(2) * 2)
-                        obstacles_list.append(new_obstacle)
-                        drawing = False
-                if event.type == KEYDOWN:
-                    if event.key == pygame.K_z and pygame.key.get_mods() & pygame.KMOD_CTRL:
-                        if obstacles_list and not done:
-                            obstacles_list.pop()
-
-        if drawing:
-            new_mx, new_my = pygame.mouse.get_pos()
-            pygame.draw.rect(screen, BLACK, (min(mx, new_mx), min(my, new_my), abs(new_mx - mx), abs(new_my - my)))
-        if not done:
-            for obstacle in obstacles_list:
-                obstacle.draw(screen)
-            pygame.draw.rect(screen, BLACK, (LEFT_PAD, NORTH_PAD, env_width, env_height), 3)
-        elif pause:
-            continue
-        else:
-            if start_time is None:
-                start_time = time.time()
-            obstacles_list_before = copy.deepcopy(obstacles_list)
-            for obstacle in obstacles_list:
-                obstacle.move()
-                obstacle.draw(screen)
-            obstacles_list_after = obstacles_list
-
-            if patience:
-                robotX, robotY = robot.pos
-                if (len(past_path) == 0) or robot.pos != past_path[-1]:
-                    past_path.append(robot.pos)
-
-                # Decision making
-                decision_start = time.time()
-                decision = robot.decisionMaking(obstacles_list_before, obstacles_list_after, local_goal)
-                decision_end = time.time()
-                with open('action/' + scenario + '/' + algorithm, 'a') as f:
-                    f.write(f'{test_map} DECISION_MAKING {round(decision_end - decision_start, 4)}\n')
-
-                for i in obstacles_list_before:
-                    if -i.width <= 2 * (robotX - i.x) <= i.width and -i.height <= 2 * (robotY - i.y) <= i.height:
-                        collision = True
-                        print(f"{i.x} {i.width} {i.y} {i.height} {robotX} {robotY}")
-
-                # print(decision)
-
-                if decision == "Replan":
-                    old_spl = copy.deepcopy(spl)
-                    replan_start = time.time()
-                    if planning_algo == 'Astar':
-                        build_start = time.time()
-                        # Choose env type
-                        if env_type == 'quadtree':
-                            env = QuadTreeEnvironment(LEFT_PAD + env_width / 2,
-                                                      NORTH_PAD + env_height / 2,
-                                                      env_width,
-                                                      env_height)
-                        elif env_type == 'grid':
-                            env = GridEnvironment(LEFT_PAD + env_width / 2,
-                                                  NORTH_PAD + env_height / 2,
-                                                  env_width,
-                                                  env_height)
-                        env.update(obstacles_list)
-                        env.build_env(robot.pos, end)
-                        priority_queue = SortedList(key=lambda x: x.key)
-                        env.goal.rhs = 0
-                        env.goal.calculate_key()
-                        priority_queue.add(env.goal)
-                        robot.solver = AStarSolver(priority_queue, env)
-                        build_end = time.time()
-                        with open('action/' + scenario + '/' + algorithm, 'a') as f:
-                            f.write(f'{test_map} ENV_DECOMPOSITION {round(build_end - build_start, 4)}\n')
-
-                    path = robot.updatePath(obstacles_list)
-                    spl = makeSpline(robot.pos, path, end)
-                    local_goal = tuple(spl[:, 200])
-                    targets = 1
-                    replan_end = time.time()
-                    with open('action/' + scenario + '/' + algorithm, 'a') as f:
-                        f.write(f'{test_map} LOCAL_REPLAN {round(replan_end - replan_start, 4)}\n')
-                if decision != "Stop":
-                    robot.pos = robot.nextPosition(local_goal)
-
-                if robot.reach(local_goal):
-                    if local_goal == end:
-                        finished = True
-                    elif len(path) > 2 and robot.enter(path[1]):
-                        path.pop(0)
-                        env.current = path[0]
-                    targets += 1
-                    if targets * 200 < spl.shape[1]:
-                        local_goal = tuple(spl[:, targets * 200])
-                    else:
-                        local_goal = end
-                patience += 1
-                if patience == PATIENCE:
-                    patience = 0
+                            mx, my = mouse_x, mouse_y
+                            drawing = True
+                            done = False
+                    if event.type == MOUSEBUTTONUP:
+                        if drawing:
+                            new_mx, new_my = event.pos
+                            new_obstacle = Obstacle((mx+new_mx)/2,
+                                                    (my+new_my)/2,
+                                                    abs(new_mx-mx),
+                                                    abs(new_my-my),
+                                                    isStatic,
+                                                    np.random.randn(2) * 2)
+                            obstacles_list.append(new_obstacle)
+                            drawing = False
+                    if event.type == KEYDOWN:
+                        if event.key == pygame.K_z and pygame.key.get_mods() & pygame.KMOD_CTRL:
+                            if obstacles_list and not done:
+                                obstacles_list.pop()
+
+            if drawing:
+                new_mx, new_my = pygame.mouse.get_pos()
+                pygame.draw.rect(screen, BLACK, (min(mx, new_mx), min(my, new_my), abs(new_mx - mx), abs(new_my - my)))
+            if not done:
+                for obstacle in obstacles_list:
+                    obstacle.draw(screen)
+                pygame.draw.rect(screen, BLACK, (LEFT_PAD, NORTH_PAD, env_width, env_height), 3)
+            elif pause:
+                continue
             else:
-                # Environment decomposition
-                build_start = time.time()
-                if env_type == 'quadtree':
-                    env = QuadTreeEnvironment(LEFT_PAD + env_width / 2, NORTH_PAD + env_height / 2, env_width, env_height)
-                elif env_type == 'grid':
-                    env = GridEnvironment(LEFT_PAD + env_width / 2, NORTH_PAD + env_height / 2, env_width, env_height)
-                env.update(obstacles_list)
-                env.build_env(robot.pos, end)
-                build_end = time.time()
-                with open('action/' + scenario + '/' + algorithm, 'a') as f:
-                    f.write(f'{test_map} ENV_DECOMPOSITION {round(build_end - build_start, 4)}\n')
-
-                # Implementing path finding algorithm
-                algo_start = time.time()
-                priority_queue = SortedList(key=lambda x: x.key)
-                env.goal.rhs = 0
-                env.goal.calculate_key()
-                priority_queue.add(env.goal)
-                # Change between A star and D star
-                if planning_algo == 'DstarLite':
-                    robot.solver = DStarLiteSolver(priority_queue, env)
-                elif planning_algo == 'Astar':
-                    robot.solver = AStarSolver(priority_queue, env)
-                path = robot.show_path()
-                algo_end = time.time()
-                with open('action/' + scenario + '/' + algorithm, 'a') as f:
-                    f.write(f'{test_map} GLOBAL_PLANNING {round(algo_end - algo_start, 4)}\n')
-
-                # Smoothen the path using Spline
-                spl = makeSpline(robot.pos, path, end)
-
-                targets = 1
-                if targets * 200 < spl.shape[1]:
-                    local_goal = tuple(spl[:, targets * 200])
+                if max_ticks is not None and clock.ticks >= max_ticks:
+                    timeout = True
+                    break
+                positions_before.capture(obstacles_list)
+                step_start = robot.pos
+                obstacles_list.move(clock.dt)
+                if trajectory is not None:
+                    trajectory.record(obstacles_list)
+                if not headless:
+                    for obstacle in obstacles_list:
+                        obstacle.draw(screen)
+
+                if not clock.every(REPLAN_PERIOD):
+                    if (len(past_path) == 0) or robot.pos != past_path[-1]:
+                        past_path.append(robot.pos)
+
+                    # Decision making
+                    decision_start = time.perf_counter()
+                    decision = robot.decisionMaking(positions_before, obstacles_list, local_goal)
+                    decision_end = time.perf_counter()
+                    telemetry.record('DECISION_MAKING', decision_end - decision_start, clock.ticks)
+
+                    # print(decision)
+
+                    if decision == "Replan":
+                        old_spl = copy.deepcopy(spl)
+                        replan_start = time.perf_counter()
+                        if planning_algo == 'Astar':
+                            build_start = time.perf_counter()
+                            env, _ = decompose()
+                            priority_queue = SortedList(key=lambda x: x.key)
+                            env.goal.rhs = 0
+                            env.goal.calculate_key()
+                            priority_queue.add(env.goal)
+                            robot.solver = AStarSolver(priority_queue, env)
+                            build_end = time.perf_counter()
+                            telemetry.record('ENV_DECOMPOSITION', build_end - build_start, clock.ticks)
+
+                        # Without a path the robot holds its position and replans
+                        path = robot.updatePath(obstacles_list)
+                        if path is not None:
+                            spl = makeSpline(robot.pos, path, end)
+                            targets = 1
+                            local_goal = spline_target(spl, targets)
+                        replan_end = time.perf_counter()
+                        telemetry.record('LOCAL_REPLAN', replan_end - replan_start, clock.ticks)
+                    if decision != "Stop" and path is not None:
+                        robot.pos = robot.nextPosition(local_goal)
+
+                    if path is not None and robot.reach(local_goal):
+                        if local_goal == end:
+                            finished = True
+                        elif len(path) > 2 and robot.enter(path[1]):
+                            path.pop(0)
+                            env.current = path[0]
+                        targets += 1
+                        local_goal = spline_target(spl, targets)
                 else:
-                    local_goal = end
-                patience += 1
-
-            # Draw path
-            drawSpline(old_spl, screen, DARK_GREY)
-            draw_path(past_path, screen, GREEN)
-            # draw_env_path(path, screen, robot.pos, end, draw_robot=True)
-            drawSpline(spl, screen, YELLOW)
-            # draw_local_goal(screen, local_goal)
-            env.draw(screen, mode="boundary")
-            draw_start(screen, begin)
-            draw_target(screen, (end[0] - 10, end[1] - 64))
-            robot.draw(screen)
-            if robot.reach(end):
-                finished = True
-            time.sleep(0.1)
-        pygame.display.update()
-
-    end_time = time.time()
-
-
-    with open("result/" + scenario + "/" + algorithm, "a") as f:
+                    # Coarse leaves on the path are decomposed again at full resolution and the path is planned
+                    # again, until it crosses none. The rounds are recorded as one decomposition and one planning
+                    refined = []
+                    build_time = algo_time = 0
+                    while True:
+                        # Environment decomposition
+                        build_start = time.perf_counter()
+                        env, kept = decompose(refined)
+                        build_end = time.perf_counter()
+                        build_time += build_end - build_start
+
+                        # Implementing path finding algorithm
+                        algo_start = time.perf_counter()
+                        if not kept:
+                            priority_queue = SortedList(key=lambda x: x.key)
+                            env.goal.rhs = 0
+                            env.goal.calculate_key()
+                            priority_queue.add(env.goal)
+                            # Change between A star and D star
+                            if planning_algo == 'DstarLite':
+                                robot.solver = DStarLiteSolver(priority_queue, env)
+                            elif planning_algo == 'Astar':
+                                robot.solver = AStarSolver(priority_queue, env)
+                        path = robot.show_path()
+                        algo_end = time.perf_counter()
+                        algo_time += algo_end - algo_start
+
+                        coarse = coarse_leaves(path)
+                        if not coarse:
+                            break
+                        refined += [(node.x, node.y) for node in coarse]
+                    telemetry.record('ENV_DECOMPOSITION', build_time, clock.ticks)
+                    telemetry.record('GLOBAL_PLANNING', algo_time, clock.ticks)
+
+                    # Smoothen the path using Spline
+                    if path is not None:
+                        spl = makeSpline(robot.pos, path, end)
+
+                        targets = 1
+                        local_goal = spline_target(spl, targets)
+
+                # Collision of the robot with the obstacles during this tick
+                for i in robot.collisions(obstacles_list, step_start, positions_before):
+                    collision = True
+                    obstacle = obstacles_list[i]
+                    print(f"{obstacle.x} {obstacle.width} {obstacle.y} {obstacle.height} "
+                          f"{step_start[0]} {step_start[1]} {robot.pos[0]} {robot.pos[1]}")
+
+                if robot.reach(end):
+                    finished = True
+                clock.tick()
+                if not headless:
+                    # Draw path
+                    drawSpline(old_spl, screen, DARK_GREY)
+                    draw_path(past_path, screen, GREEN)
+                    # draw_env_path(path, screen, robot.pos, end, draw_robot=True)
+                    drawSpline(spl, screen, YELLOW)
+                    # draw_local_goal(screen, local_goal)
+                    env.draw(screen, mode="boundary")
+                    draw_start(screen, begin)
+                    draw_target(screen, (end[0] - 10, end[1] - 64))
+                    robot.draw(screen)
+                    time.sleep(clock.dt)
+            if not headless:
+                pygame.display.update()
+    finally:
+        telemetry.close()
+        if trajectory is not None:
+            trajectory.close()
+
+    with open(result_path, "a") as f:
         d = 0
         for i in range(1, len(past_path)):
             d += np.sqrt(np.sum(np.square(np.array(past_path[i-1]) - np.array(past_path[i]))))
@@ -297,13 +392,15 @@ def main(algorithm, scenario, test_map, interactive=True):
         for i in range(1, len(past_path) - 1):
             count += 1
             smooth += angle(past_path[i - 1], past_path[i], past_path[i + 1])
+        # A robot that never got past its first move has no turns to average
+        smoothness = round((smooth / count) * 180 / np.pi, 4) if count else 0
         # Write distance, smoothness and time of an execution to an output file
         # f.write(map + ' ' + str(round(d, 4)) + ' ' + str(round((smooth / count) * 180 / np.pi, 4)) +
         #         ' ' + str(round(end_time - start_time, 4)) + '\n')
-        if collision:
-            f.write(f"{test_map}: {round(d, 4)} {round((smooth / count) * 180 / np.pi, 4)} {round(end_time - start_time, 4)} Fail \n")
+        if collision or timeout:
+            f.write(f"{test_map}: {round(d, 4)} {smoothness} {round(clock.time, 4)} Fail \n")
         else:
-            f.write(f"{test_map}: {round(d, 4)} {round((smooth / count) * 180 / np.pi, 4)} {round(end_time - start_time, 4)} \n")
+            f.write(f"{test_map}: {round(d, 4)} {smoothness} {round(clock.time, 4)} \n")
         # print(f"{start_time} {end_time}")
 
 
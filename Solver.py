@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
+import math
 import numpy as np
-from AABB import cost
+from AABB import cost, overlapping, passability
 
 
 class PriorityQueueSolver(ABC):
@@ -20,17 +21,45 @@ class PriorityQueueSolver(ABC):
     def replan_path(self, obstacles):
         pass
 
+    # Nodes from the current node to the goal, or None when the search found no path
     @abstractmethod
     def show_path(self):
         pass
 
 
 class DStarLiteSolver(PriorityQueueSolver):
+    def __init__(self, queue=None, graph=None):
+        super().__init__(queue, graph)
+        # Leaves whose value replan_path changed from sensing, for the environment to recompute (see
+        # QuadTreeEnvironment.refresh)
+        self.sensed = set()
+        # Key modifier: the distance the robot moved since the search started. The keys queued before a move
+        # stay lower bounds and are only recomputed when they reach the front of the queue
+        self.km = 0
+        self.last = graph.current if graph is not None else None
+
+    # D* Lite key. The search runs from the goal, so the heuristic is the distance to the robot's node, scaled
+    # down to the least cost() charges for the last edge into the vertex: entering a blocked leaf costs next to
+    # nothing, and a larger heuristic would leave a blocked leaf's outdated g unsettled on the path
+    def key(self, vertex):
+        current = self.graph.current
+        g = min(vertex.g, vertex.rhs)
+        h = math.hypot(vertex.x - current.x, vertex.y - current.y) * (passability(vertex) - 1e-6) / (1 + 1e-6)
+        return g + h + self.km, g
+
     def compute_path(self):
-        while (self.queue and (self.queue[0].key < self.graph.current.calculate_key())) or \
-                (self.graph.current.g != self.graph.current.rhs):
+        current = self.graph.current
+        if current is not self.last:
+            self.km += math.hypot(current.x - self.last.x, current.y - self.last.y)
+            self.last = current
+        while (self.queue and self.queue[0].key < self.key(current)) or current.g != current.rhs:
             v = self.queue.pop(0)
-            if v.g > v.rhs:
+            key = self.key(v)
+            if v.key < key:
+                # Queued before the robot moved
+                v.key = key
+                self.queue.add(v)
+            elif v.g > v.rhs:
                 v.g = v.rhs
                 for u in v.neighbors:
                     self.update_vertex(u)
@@ -44,8 +73,13 @@ class DStarLiteSolver(PriorityQueueSolver):
         self.compute_path()
         path = [self.graph.current]
         current = self.graph.current
+        visited = {current}
         while current != self.graph.goal:
             current = min(current.neighbors, key=lambda x: x.g)
+            # No consistent path to the goal: report it instead of cycling forever
+            if current in visited:
+                return None
+            visited.add(current)
             path.append(current)
         return path
 
@@ -54,15 +88,30 @@ class DStarLiteSolver(PriorityQueueSolver):
             vertex.calculate_rhs()
         self.queue.discard(vertex)
         if vertex.g != vertex.rhs:
-            vertex.calculate_key()
+            vertex.key = self.key(vertex)
             self.queue.add(vertex)
 
+    # Bring the search up to date with an environment refresh (see QuadTreeEnvironment.refresh): removed leaves
+    # leave the queue and their remaining neighbors lose an edge, added and changed leaves are updated with
+    # their neighbors. The goal must be the same node as before
+    def repair(self, removed, changed):
+        gone = set(removed)
+        for node in removed:
+            self.queue.discard(node)
+        touched = dict.fromkeys(changed)
+        for node in removed:
+            touched.update((neighbor, None) for neighbor in node.neighbors if neighbor not in gone)
+        for node in changed:
+            touched.update((neighbor, None) for neighbor in node.neighbors)
+        for node in touched:
+            self.update_vertex(node)
+
     def replan_path(self, obstacles):
         threshold = 1e-3
         changes = []
         for n in self.graph.current.neighbors:
             percentage = 0
-            for obstacle in obstacles:
+            for obstacle in overlapping(obstacles, n):
                 percentage += n.get_intersect_percentage(obstacle)
                 if percentage >= threshold:
                     if n.value != 1:
@@ -70,9 +119,14 @@ class DStarLiteSolver(PriorityQueueSolver):
                         n.value = 1
                     break
             if percentage < threshold:
-                if n.value:
+                if n.value or n.unknown:
                     changes.append(n)
                 n.value = 0
+        for change in changes:
+            if change.unknown:
+                # Sensed, so no longer left coarse
+                change.unknown = False
+        self.sensed.update(changes)
         for change in changes:
             self.update_vertex(change)
             for n in change.neighbors:
@@ -82,6 +136,12 @@ class DStarLiteSolver(PriorityQueueSolver):
 
 
 class AStarSolver(PriorityQueueSolver):
+    def __init__(self, queue=None, graph=None):
+        super().__init__(queue, graph)
+        # The queue is ordered by node.h, which the environment only computes for the solvers that need it
+        if graph is not None:
+            graph.compute_heuristic()
+
     def compute_path(self):
         visited = set()
         while self.queue:
@@ -103,8 +163,13 @@ class AStarSolver(PriorityQueueSolver):
         self.compute_path()
         path = [self.graph.current]
         current = self.graph.current
+        visited = {current}
         while current != self.graph.goal:
             current = min(current.neighbors, key=lambda x: x.rhs)
+            # No consistent path to the goal: report it instead of cycling forever
+            if current in visited:
+                return None
+            visited.add(current)
             path.append(current)
         return path
 
@@ -0,0 +1,68 @@
+from collections import defaultdict
+import numpy as np
+
+
+# Uniform-grid spatial hash over axis-aligned boxes. Every box id is registered in all the cells its
+# bounds overlap; update() only re-registers the boxes whose cell range actually changed
+class SpatialHash:
+    def __init__(self, cell_size=32):
+        self.cell_size = cell_size
+        self.cells = defaultdict(set)
+        self.ranges = np.empty((0, 4), dtype=int)
+
+    # (x1, x2, y1, y2) cell index ranges, inclusive, of boxes given by their top-left / bottom-right corners
+    def cell_ranges(self, lower, upper):
+        lower = np.floor_divide(lower, self.cell_size).astype(int)
+        upper = np.floor_divide(upper, self.cell_size).astype(int)
+        return np.column_stack([lower[:, 0], upper[:, 0], lower[:, 1], upper[:, 1]])
+
+    def add(self, i, cell_range):
+        x1, x2, y1, y2 = cell_range
+        for cx in range(x1, x2 + 1):
+            for cy in range(y1, y2 + 1):
+                self.cells[(cx, cy)].add(i)
+
+    def remove(self, i, cell_range):
+        x1, x2, y1, y2 = cell_range
+        for cx in range(x1, x2 + 1):
+            for cy in range(y1, y2 + 1):
+                cell = self.cells[(cx, cy)]
+                cell.discard(i)
+                if not cell:
+                    del self.cells[(cx, cy)]
+
+    def build(self, lower, upper):
+        self.cells = defaultdict(set)
+        self.ranges = self.cell_ranges(lower, upper)
+        for i, cell_range in enumerate(self.ranges.tolist()):
+            self.add(i, cell_range)
+
+    # Re-register the boxes that crossed a cell border; returns their ids
+    def update(self, lower, upper):
+        ranges = self.cell_ranges(lower, upper)
+        changed = np.flatnonzero(np.any(ranges != self.ranges, axis=1))
+        for i in changed.tolist():
+            self.remove(i, self.ranges[i].tolist())
+            self.add(i, ranges[i].tolist())
+        self.ranges = ranges
+        return changed
+
+    # Sorted ids of the boxes registered in any cell overlapping the rectangle. This is a superset of
+    # the boxes overlapping it; callers do the exact test on the candidates
+    def query_rect(self, x1, x2, y1, y2):
+        (cx1, cx2, cy1, cy2), = self.cell_ranges(np.array([[x1, y1]]), np.array([[x2, y2]])).tolist()
+        candidates = set()
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self.cells):
+            for (cx, cy), cell in self.cells.items():
+                if cx1 <= cx <= cx2 and cy1 <= cy <= cy2:
+                    candidates |= cell
+        else:
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    cell = self.cells.get((cx, cy))
+                    if cell:
+                        candidates |= cell
+        return np.array(sorted(candidates), dtype=int)
+
+    def query_point(self, x, y):
+        return self.query_rect(x, x, y, y)
@@ -0,0 +1,43 @@
+import numpy as np
+
+PHASES = ['ENV_DECOMPOSITION', 'GLOBAL_PLANNING', 'LOCAL_REPLAN', 'DECISION_MAKING']
+# Layout of one binary telemetry record. Binary files are plain concatenations of records,
+# so they can be appended to, merged with cat and loaded with load_records
+RECORD = np.dtype([('map', 'S16'), ('phase', 'u1'), ('duration', 'f8'), ('tick', 'u4')])
+
+
+def load_records(path):
+    return np.fromfile(path, dtype=RECORD)
+
+
+# Buffers phase timings in memory and writes them in bulk, when the buffer is full or on close().
+# The text file keeps the "<map> <PHASE> <seconds>" format of action/; binary_path additionally
+# receives the raw records
+class TelemetryWriter:
+    def __init__(self, path, test_map, binary_path=None, buffer_size=4096):
+        self.path = path
+        self.binary_path = binary_path
+        self.test_map = test_map
+        self.records = np.empty(buffer_size, dtype=RECORD)
+        self.size = 0
+
+    def record(self, phase, duration, tick):
+        if self.size == self.records.shape[0]:
+            self.flush()
+        self.records[self.size] = (self.test_map, PHASES.index(phase), duration, tick)
+        self.size += 1
+
+    def flush(self):
+        if self.size == 0:
+            return
+        records = self.records[:self.size]
+        with open(self.path, 'a') as f:
+            f.write(''.join(f'{self.test_map} {PHASES[phase]} {round(float(duration), 4)}\n'
+                            for phase, duration in zip(records['phase'], records['duration'])))
+        if self.binary_path is not None:
+            with open(self.binary_path, 'ab') as f:
+                records.tofile(f)
+        self.size = 0
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,55 @@
+import numpy as np
+
+# Trajectory files start with one HEADER record: the obstacle count of every frame and the dtype of the
+# centres, which follow as raw (ticks, obstacles, 2) values
+HEADER = np.dtype([('magic', 'S4'), ('version', '<u4'), ('obstacles', '<u4'), ('dtype', 'S4')])
+MAGIC = b'TRAJ'
+VERSION = 1
+DTYPE = np.dtype('<f8')
+
+
+def load_trajectory(path):
+    with open(path, 'rb') as f:
+        header = np.fromfile(f, dtype=HEADER, count=1)
+        if header.shape[0] == 0:
+            return np.empty((0, 0, 2), dtype=DTYPE)
+        header = header[0]
+        if header['magic'] != MAGIC or header['version'] != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} trajectory file')
+        return np.fromfile(f, dtype=np.dtype(header['dtype'].decode())).reshape(-1, int(header['obstacles']), 2)
+
+
+# Full obstacle trajectory for replays. Centres are buffered for `chunk` ticks and appended to path
+# as raw float64 in one write, so memory stays constant however long the run is. The header is written
+# with the first frame; every later frame must have the same number of obstacles.
+# load_trajectory(path) gives back a (ticks, n_obstacles, 2) array
+class TrajectoryRecorder:
+    def __init__(self, path, chunk=256):
+        self.path = path
+        self.chunk = chunk
+        self.buffer = None
+        self.size = 0
+        open(path, 'wb').close()
+
+    def record(self, obstacle_set):
+        if self.buffer is None:
+            header = np.array([(MAGIC, VERSION, len(obstacle_set), DTYPE.str.encode())], dtype=HEADER)
+            with open(self.path, 'ab') as f:
+                header.tofile(f)
+            self.buffer = np.empty((self.chunk, len(obstacle_set), 2), dtype=DTYPE)
+        elif self.buffer.shape[1] != len(obstacle_set):
+            raise ValueError(f'trajectory of {self.buffer.shape[1]} obstacles got a frame of {len(obstacle_set)}')
+        self.buffer[self.size] = obstacle_set.centers
+        self.size += 1
+        if self.size == self.chunk:
+            self.flush()
+
+    def flush(self):
+        if self.size == 0:
+            return
+        with open(self.path, 'ab') as f:
+            self.buffer[:self.size].tofile(f)
+        self.size = 0
+
+    def close(self):
+        self.flush()
@@ -1,16 +1,26 @@
 import os
+import sys
 import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Telemetry import PHASES, load_records
 pd.set_option('display.max_colwidth', None)
 pd.set_option('display.max_rows', None)
 
 # scenarios = ['dense', 'maze', 'room', 'trap']
 scenario = input("Scenario: ")
 actions = ['ENV_DECOMPOSITION', 'GLOBAL_PLANNING', 'LOCAL_REPLAN', 'DECISION_MAKING']
-algorithms = os.listdir(scenario)
+algorithms = [f for f in os.listdir(scenario) if not f.endswith('.bin')]
 
 result = []
 for algorithm in algorithms:
-    df = pd.read_csv(scenario + '/' + algorithm, sep=' ', names=['Map', 'Action', 'Time'])
+    # Prefer the binary records written with binary telemetry, they load without text parsing
+    if os.path.exists(scenario + '/' + algorithm + '.bin'):
+        records = load_records(scenario + '/' + algorithm + '.bin')
+        df = pd.DataFrame({'Map': records['map'].astype(str),
+                           'Action': pd.Categorical.from_codes(records['phase'], PHASES).astype(str),
+                           'Time': records['duration']})
+    else:
+        df = pd.read_csv(scenario + '/' + algorithm, sep=' ', names=['Map', 'Action', 'Time'])
     index = pd.MultiIndex.from_product([df['Map'].unique(), actions], names=['Map', 'Action'])
     df = df.groupby(['Map', 'Action']).aggregate(['sum', 'mean'])
     df = df.reindex(index, fill_value=0)
@@ -2,12 +2,16 @@ import numpy as np
 import pygame
 from DecisionMaking import DecisionMaking
 from Solver import PriorityQueueSolver
+from AABB import ObstacleSet
 from Colors import *
 
 class Robot:
-    def __init__(self, start: tuple, solver: PriorityQueueSolver, decisionMaker: DecisionMaking, r=40):
+    # r: sensor range, footprint: radius of the robot's body for collision checks, 0 for a point robot (which is
+    # all the planners account for: they do not inflate obstacles)
+    def __init__(self, start: tuple, solver: PriorityQueueSolver, decisionMaker: DecisionMaking, r=40, footprint=0):
         self.pos = start
         self.r = r
+        self.footprint = footprint
         self.solver = solver
         self.decisionMaker = decisionMaker
 
@@ -24,7 +28,7 @@ class Robot:
                              self.r,
                              1)
         # draw the robot
-        pygame.draw.circle(window, RED, self.pos, 8, 0)
+        pygame.draw.circle(window, RED, self.pos, self.footprint or 8, 0)
         
     def reach(self, goal, epsilon=8):
         robotX, robotY = self.pos
@@ -60,7 +64,19 @@ class Robot:
         # return new_path
         return self.solver.replan_path(obstacles)
 
+    # Indices of the obstacles the robot hit during a tick that it started at start, with the obstacles at
+    # positions_before (a PositionSnapshot). A point robot is tested where it stood against the obstacles where
+    # they stood; a footprint is swept from start to the current position against the moved obstacles
+    def collisions(self, obstacles_list, start, positions_before):
+        if not self.footprint:
+            half = obstacles_list.sizes / 2
+            return np.flatnonzero((np.abs(start[0] - positions_before.x) <= half[:, 0]) &
+                                  (np.abs(start[1] - positions_before.y) <= half[:, 1]))
+        return obstacles_list.swept_collisions(start, self.pos, self.footprint)
+
     def detect(self, obstacles_list):
+        if isinstance(obstacles_list, ObstacleSet):
+            return obstacles_list.select(obstacles_list.query_circle(self.pos, self.r))
         obstacles = []
         for obstacle in obstacles_list:
             x1, x2, y1, y2 = obstacle.return_coordinate()
@@ -75,8 +91,8 @@ class Robot:
         return goal
         # return PSO(30, 25, self.pos, goal)
 
-    def decisionMaking(self, obstacles_list_before, obstacles_list_after, goal):
-        self.decisionMaker.update(obstacles_list_before, obstacles_list_after, goal)
+    def decisionMaking(self, positions_before, obstacles_list, goal):
+        self.decisionMaker.update(positions_before, obstacles_list, goal)
         return self.decisionMaker.decisionMaking(self)
 
         # self.onlyReplan.update(obstacles_list_before, obstacles_list_after, goal)